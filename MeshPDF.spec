@@ -11,9 +11,6 @@ a = Analysis(
         'PyQt6.QtWidgets',
         'PyQt6.QtPrintSupport',
         'fitz',  # PyMuPDF
-        'PIL',
-        'PIL.Image',
-        'numpy',
     ],
     hookspath=[],
     hooksconfig={},
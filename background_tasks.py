@@ -0,0 +1,55 @@
+from PyQt6.QtCore import QObject, pyqtSignal
+import threading
+import traceback
+
+class BackgroundTask(QObject):
+    """Run a long operation on a worker thread with progress and cooperative cancellation"""
+    # The function is called as func(*args, progress=..., cancelled=..., **kwargs).
+    # progress(done, total, message) may be called from the worker thread; the
+    # signals below are delivered on the GUI thread.
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(object)  # Return value of the function
+    failed = pyqtSignal(str)  # Error message if the function raised
+
+    def __init__(self, func, *args, **kwargs):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the worker thread"""
+        self.thread = threading.Thread(target=self._run, daemon=True, name="meshpdf-task")
+        self.thread.start()
+
+    def cancel(self):
+        """Ask the function to stop at its next cancellation check"""
+        self.cancel_event.set()
+
+    def is_cancelled(self):
+        """True once cancel() has been called"""
+        return self.cancel_event.is_set()
+
+    def is_running(self):
+        """True while the worker thread is alive"""
+        return self.thread is not None and self.thread.is_alive()
+
+    def _report_progress(self, done, total, message=""):
+        """Worker thread: forward progress to the GUI thread"""
+        self.progress.emit(done, total, message)
+
+    def _run(self):
+        """Worker thread: call the function and emit its outcome"""
+        try:
+            result = self.func(*self.args, progress=self._report_progress,
+                               cancelled=self.is_cancelled, **self.kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self.failed.emit(str(e))
+            return
+        self.finished.emit(result)
+
+# Export class
+__all__ = ['BackgroundTask']
@@ -0,0 +1,217 @@
+"""Headless batch stamping: apply one overlay spec to many PDFs in parallel.
+
+Usage:
+    python batch_stamp.py spec.json "incoming/*.pdf" other.pdf -o stamped/
+
+The spec is JSON with coordinates in PDF points (1/72 inch, origin at the
+top-left corner of the page):
+
+    {
+        "overlays": [
+            {"type": "text", "page": 0, "x": 72, "y": 40,
+             "text": "APPROVED", "font_size": 14},
+            {"type": "signature", "page": -1, "rect": [380, 700, 540, 780],
+             "image": "signature.png"}
+        ]
+    }
+
+"page" is a zero-based index (negative values count from the end) or "all".
+Text "x"/"y" is the top-left corner of the text. Signature images are PNGs
+(with transparency) or JPEGs, resolved relative to the spec file.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import fitz  # PyMuPDF
+
+from pdf_editor import PDFEditor
+
+# Encoded signature images read by this worker process, keyed by path
+_image_cache = {}
+
+def load_spec(spec_path):
+    """Read and validate an overlay spec, resolving image paths"""
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    overlays = spec.get('overlays') if isinstance(spec, dict) else None
+    if not overlays:
+        raise ValueError("Spec must contain a non-empty 'overlays' list")
+
+    base_dir = os.path.dirname(os.path.abspath(spec_path))
+    for i, overlay in enumerate(overlays):
+        kind = overlay.get('type')
+        page = overlay.get('page', 0)
+        if page != 'all' and not isinstance(page, int):
+            raise ValueError(f"Overlay {i}: 'page' must be an integer or \"all\"")
+        if kind == 'text':
+            if not overlay.get('text') or 'x' not in overlay or 'y' not in overlay:
+                raise ValueError(f"Overlay {i}: text overlays need 'text', 'x' and 'y'")
+        elif kind == 'signature':
+            if len(overlay.get('rect', [])) != 4 or not overlay.get('image'):
+                raise ValueError(f"Overlay {i}: signature overlays need 'rect' [x0, y0, x1, y1] and 'image'")
+            overlay['image'] = os.path.join(base_dir, overlay['image'])
+            if not os.path.exists(overlay['image']):
+                raise ValueError(f"Overlay {i}: image not found: {overlay['image']}")
+        else:
+            raise ValueError(f"Overlay {i}: unknown type {kind!r}")
+    return overlays
+
+def expand_inputs(patterns):
+    """Expand globs (for shells that do not) and drop duplicates, keeping order"""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            key = os.path.abspath(path)
+            if key not in seen:
+                seen.add(key)
+                paths.append(path)
+    return paths
+
+def output_path_for(input_path, output_dir, suffix):
+    """Destination for a stamped copy of input_path"""
+    stem, ext = os.path.splitext(os.path.basename(input_path))
+    directory = output_dir or os.path.dirname(input_path)
+    return os.path.join(directory, f"{stem}{suffix}{ext or '.pdf'}")
+
+def find_output_collisions(inputs, output_dir, suffix):
+    """Map each output path that more than one input would be written to onto those inputs"""
+    # With --output-dir, a/x.pdf and b/x.pdf both become <dir>/x<suffix>.pdf; paths are
+    # compared case-insensitively where the file system is (Windows)
+    targets = {}
+    for path in inputs:
+        output_path = output_path_for(path, output_dir, suffix)
+        targets.setdefault(os.path.normcase(os.path.abspath(output_path)), (output_path, []))[1].append(path)
+    return {output_path: sources for output_path, sources in targets.values() if len(sources) > 1}
+
+def _load_image(path):
+    """Read a signature image once per worker process"""
+    image = _image_cache.get(path)
+    if image is None:
+        with open(path, 'rb') as f:
+            image = f.read()
+        _image_cache[path] = image
+    return image
+
+def stamp_file(input_path, output_path, overlays, optimize=False, verbose=False):
+    """Apply overlays to one PDF; returns a result dict instead of raising"""
+    start = time.perf_counter()
+    result = {'input': input_path, 'output': output_path, 'ok': False, 'error': None}
+    try:
+        # Check the input up front so failures get a useful message
+        doc = fitz.open(input_path)
+        try:
+            if doc.is_encrypted:
+                raise ValueError("document is encrypted")
+            page_count = len(doc)
+        finally:
+            doc.close()
+
+        editor = PDFEditor()
+        log = io.StringIO()
+        with contextlib.redirect_stdout(sys.stdout if verbose else log):
+            editor.set_current_pdf(input_path)
+            for overlay in overlays:
+                pages = range(page_count) if overlay.get('page', 0) == 'all' else [overlay.get('page', 0)]
+                for page_num in pages:
+                    if not -page_count <= page_num < page_count:
+                        raise ValueError(f"page {page_num} out of range (document has {page_count} pages)")
+                    page_num %= page_count
+                    if overlay['type'] == 'text':
+                        editor.add_text_at(overlay['text'], page_num,
+                                           fitz.Point(overlay['x'], overlay['y']),
+                                           overlay.get('font_size', 14))
+                    else:
+                        editor.add_signature_image(_load_image(overlay['image']), page_num,
+                                                   fitz.Rect(overlay['rect']))
+            ok = editor.save_pdf(output_path, optimize=optimize)
+        if not ok:
+            lines = log.getvalue().strip().splitlines()
+            raise RuntimeError(f"save failed: {lines[-1]}" if lines else "save failed")
+        result['ok'] = True
+        result['pages'] = page_count
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def run_batch(overlays, inputs, output_dir=None, suffix='_stamped', jobs=None, optimize=False,
+              verbose=False):
+    """Stamp every input on a process pool, printing one line per file"""
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(stamp_file, path, output_path_for(path, output_dir, suffix), overlays,
+                        optimize, verbose)
+            for path in inputs
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if result['ok']:
+                print(f"OK      {result['input']} -> {result['output']} ({result['seconds']:.2f}s)")
+            else:
+                print(f"FAILED  {result['input']}: {result['error']}")
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for r in results if r['ok'])
+    rate = len(results) / elapsed if elapsed > 0 else 0.0
+    print(f"\nStamped {succeeded}/{len(results)} documents in {elapsed:.2f}s ({rate:.1f} docs/sec)")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a JSON overlay spec to many PDFs without the GUI.")
+    parser.add_argument('spec', help="JSON overlay spec (coordinates in PDF points)")
+    parser.add_argument('inputs', nargs='+', help="PDF files or glob patterns")
+    parser.add_argument('-o', '--output-dir', help="Directory for stamped files (default: next to each input)")
+    parser.add_argument('--suffix', default='_stamped', help="Suffix added to output file names (default: _stamped)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--optimize', action='store_true',
+                        help="Fully rewrite and recompress each file instead of appending an incremental update")
+    parser.add_argument('--report', help="Write per-file results as JSON to this path")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show the editor's log output")
+    args = parser.parse_args(argv)
+
+    try:
+        overlays = load_spec(args.spec)
+    except (OSError, ValueError) as e:
+        parser.error(f"invalid spec: {e}")
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        parser.error("no input files matched")
+    if not args.output_dir and not args.suffix:
+        parser.error("an empty --suffix requires --output-dir, or inputs would be overwritten")
+    collisions = find_output_collisions(inputs, args.output_dir, args.suffix)
+    if collisions:
+        details = "".join(f"\n  {output_path} <- {', '.join(sources)}"
+                          for output_path, sources in collisions.items())
+        parser.error(f"several inputs would be written to the same file; rename them or stamp "
+                     f"them in separate runs:{details}")
+
+    results = run_batch(overlays, inputs, args.output_dir, args.suffix, args.jobs, args.optimize,
+                        args.verbose)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    return 0 if all(r['ok'] for r in results) else 1
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Needed for process pools in frozen Windows builds
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""Backend benchmarks over synthetic PDFs, with JSON results and baseline comparison.
+
+Usage:
+    python benchmark.py -o results.json
+    python benchmark.py --pages 10 100 --compare baseline.json
+
+Synthetic documents are generated first and are not timed. There are two kinds:
+"text" documents have about 60 lines of text per page. "image" documents have a
+full-page JPEG on every page, drawn from a pool of distinct images.
+
+For every page count, the benchmarks time:
+  - merge:  PDFEditor.merge_pdfs over the text and image documents
+  - save:   PDFEditor.save_pdf with N signature and text overlays spread over the pages
+  - render: rasterizing sample pages at each zoom level, at the viewer's scale
+  - display: turning those rasterized pages into the QPixmaps the viewer shows,
+             with the bytes copied per page. "native" is the current pipeline,
+             "rgb888" the conversion used before, kept for reference. Page count
+             does not matter here, so it only runs on the smallest documents.
+
+Each case runs in a fresh process, so its peak RSS is its own. With --compare,
+cases are matched by name against a stored results file. Any case slower than
+the baseline by more than --threshold is reported as a regression, and the exit
+status is then 1.
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from pdf_editor import PDFEditor
+
+DEFAULT_PAGES = [10, 500, 5000]
+DEFAULT_OVERLAYS = [10, 500]
+DEFAULT_ZOOMS = [0.5, 1.0, 2.0, 4.0]
+RENDER_SAMPLE_PAGES = 10  # Pages rasterized per zoom level
+IMAGE_POOL_SIZE = 16  # Distinct page images in an image document
+VIEWER_SCALE_FACTOR = 2  # PDFViewer.scale_factor: pixels per PDF point at 100% zoom
+DISPLAY_PIPELINES = ['native', 'rgb888']
+
+LOREM = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua. Ut enim ad minim veniam, quis nostrud")
+
+def make_text_pdf(path, pages):
+    """Write a text-heavy document"""
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()  # A4
+        lines = [f"Page {page_num + 1} line {line + 1}: {LOREM}" for line in range(60)]
+        page.insert_text((36, 48), "\n".join(lines), fontsize=6.5, lineheight=1.8)
+    doc.save(path, deflate=True)
+    doc.close()
+
+def make_page_image(seed, width=1240, height=1754):
+    """JPEG bytes of a smooth, seed-dependent pattern about the size of a 150 dpi A4 scan"""
+    row = bytes((x // 3 + seed * 37 + (x % 3) * 60) % 256 for x in range(width * 6))
+    samples = b''.join(row[(y // 4 * 3) % (width * 3):][:width * 3] for y in range(height))
+    pixmap = fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+    return pixmap.tobytes('jpg', jpg_quality=75)
+
+def make_image_pdf(path, pages):
+    """Write an image-heavy document; pages reuse a pool of distinct images"""
+    doc = fitz.open()
+    pool = [make_page_image(seed) for seed in range(min(pages, IMAGE_POOL_SIZE))]
+    xrefs = {}
+    for page_num in range(pages):
+        page = doc.new_page()
+        index = page_num % len(pool)
+        if index in xrefs:
+            page.insert_image(page.rect, xref=xrefs[index])
+        else:
+            xrefs[index] = page.insert_image(page.rect, stream=pool[index])
+    doc.save(path)
+    doc.close()
+
+def make_signature_png():
+    """PNG bytes of a transparent signature-like stroke"""
+    width, height = 380, 200
+    samples = bytearray(width * height * 4)
+    for x in range(10, 370):
+        y = 150 - (x - 10) * 120 // 360
+        for dy in range(-2, 3):
+            offset = ((y + dy) * width + x) * 4
+            samples[offset:offset + 4] = b'\x00\x00\x64\xff'
+    return fitz.Pixmap(fitz.csRGB, width, height, bytes(samples), True).tobytes('png')
+
+def document_path(data_dir, kind, pages):
+    """Path of a generated document, creating it if needed"""
+    path = os.path.join(data_dir, f"{kind}_{pages}.pdf")
+    if not os.path.exists(path):
+        (make_text_pdf if kind == 'text' else make_image_pdf)(path, pages)
+    return path
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where it cannot be read"""
+    # On Linux ru_maxrss survives exec, so a worker would report the parent's peak
+    # if that was higher; VmHWM belongs to the worker's own address space
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def bench_merge(data_dir, pages):
+    """Time merging the text and image documents of one size"""
+    paths = [document_path(data_dir, 'text', pages), document_path(data_dir, 'image', pages)]
+    editor = PDFEditor()
+    start = time.perf_counter()
+    merged = editor.merge_pdfs(paths)
+    seconds = time.perf_counter() - start
+    report = editor.last_merge_report
+    if isinstance(merged, str):
+        size = os.path.getsize(merged)
+        os.remove(merged)  # Spooled to a temp file
+    else:
+        size = len(merged)
+    return {'seconds': seconds, 'pages_out': report['total_pages'], 'bytes_out': size,
+            'spooled': report['spooled']}
+
+def bench_save(data_dir, kind, pages, overlays):
+    """Time saving one document with overlays spread over its pages"""
+    path = document_path(data_dir, kind, pages)
+    output_path = os.path.join(data_dir, f"save_{kind}_{pages}_{overlays}.pdf")
+    signature = make_signature_png()
+    editor = PDFEditor()
+    editor.set_current_pdf(path)
+    start = time.perf_counter()
+    for i in range(overlays):
+        page_num = i * pages // overlays
+        if i % 2:
+            editor.add_text_at(f"Overlay {i}", page_num, (72, 72 + i % 10 * 20), 12)
+        else:
+            editor.add_signature_image(signature, page_num, (380, 700, 540, 780))
+    add_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    ok = editor.save_pdf(output_path)
+    seconds = time.perf_counter() - start
+    if not ok:
+        raise RuntimeError("save_pdf failed")
+    size = os.path.getsize(output_path)
+    os.remove(output_path)
+    return {'seconds': seconds, 'add_seconds': add_seconds, 'bytes_out': size}
+
+def bench_render(data_dir, kind, pages, zoom):
+    """Time rasterizing sample pages at one zoom level, as the viewer does"""
+    path = document_path(data_dir, kind, pages)
+    doc = fitz.open(path)
+    try:
+        sample = min(pages, RENDER_SAMPLE_PAGES)
+        step = pages // sample
+        scale = VIEWER_SCALE_FACTOR * zoom
+        matrix = fitz.Matrix(scale, scale)
+        start = time.perf_counter()
+        for i in range(sample):
+            doc[i * step].get_pixmap(matrix=matrix)
+        seconds = time.perf_counter() - start
+    finally:
+        doc.close()
+    return {'seconds': seconds, 'pages_rendered': sample,
+            'seconds_per_page': seconds / sample}
+
+def bench_display(data_dir, kind, pages, zoom, pipeline):
+    """Time converting rasterized sample pages to QPixmaps, counting the bytes copied"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # Worker processes need no display
+    from PyQt6.QtGui import QGuiApplication, QImage, QPixmap
+    from page_renderer import qimage_from_pixmap
+    app = QGuiApplication.instance() or QGuiApplication(['benchmark'])
+    path = document_path(data_dir, kind, pages)
+    doc = fitz.open(path)
+    try:
+        sample = min(pages, RENDER_SAMPLE_PAGES)
+        step = pages // sample
+        scale = VIEWER_SCALE_FACTOR * zoom
+        matrix = fitz.Matrix(scale, scale)
+        seconds = 0.0
+        copied = 0
+        for i in range(sample):
+            pix = doc[i * step].get_pixmap(matrix=matrix)  # Not timed; see the render benchmark
+            start = time.perf_counter()
+            if pipeline == 'native':
+                image = qimage_from_pixmap(pix)
+                copied += image.sizeInBytes()
+            else:
+                samples = pix.samples  # A bytes copy of the fitz buffer
+                image = QImage(samples, pix.width, pix.height, pix.stride, QImage.Format.Format_RGB888).copy()
+                copied += len(samples) + image.sizeInBytes()
+            pixmap = QPixmap.fromImage(image)
+            seconds += time.perf_counter() - start
+            shown = pixmap.toImage()
+            if int(shown.constBits()) != int(image.constBits()):
+                copied += shown.sizeInBytes()  # fromImage converted instead of sharing
+            del pix, image, pixmap, shown
+    finally:
+        doc.close()
+    return {'seconds': seconds, 'pages_converted': sample, 'seconds_per_page': seconds / sample,
+            'bytes_copied_per_page': copied // sample}
+
+BENCHMARKS = {'merge': bench_merge, 'save': bench_save, 'render': bench_render, 'display': bench_display}
+
+def plan_cases(pages_list, overlay_counts, zooms, benchmarks):
+    """List the cases to run as dicts with a unique 'name'"""
+    cases = []
+    for pages in pages_list:
+        if 'merge' in benchmarks:
+            cases.append({'name': f"merge/{pages}", 'benchmark': 'merge', 'args': [pages]})
+        for kind in ('text', 'image'):
+            if 'save' in benchmarks:
+                for overlays in overlay_counts:
+                    cases.append({'name': f"save/{kind}/{pages}/overlays={overlays}",
+                                  'benchmark': 'save', 'args': [kind, pages, overlays]})
+            if 'render' in benchmarks:
+                for zoom in zooms:
+                    cases.append({'name': f"render/{kind}/{pages}/zoom={zoom:g}",
+                                  'benchmark': 'render', 'args': [kind, pages, zoom]})
+            if 'display' in benchmarks and pages == min(pages_list):
+                for zoom in zooms:
+                    for pipeline in DISPLAY_PIPELINES:
+                        cases.append({'name': f"display/{kind}/zoom={zoom:g}/{pipeline}",
+                                      'benchmark': 'display', 'args': [kind, pages, zoom, pipeline]})
+    return cases
+
+def prepare_documents(data_dir, cases):
+    """Generate every document the cases need, outside the timed runs"""
+    for case in cases:
+        if case['benchmark'] == 'merge':
+            needed = [('text', case['args'][0]), ('image', case['args'][0])]
+        else:
+            needed = [tuple(case['args'][:2])]
+        for kind, pages in needed:
+            if not os.path.exists(os.path.join(data_dir, f"{kind}_{pages}.pdf")):
+                print(f"Generating {kind} document with {pages} pages...")
+                document_path(data_dir, kind, pages)
+
+def run_case(case, data_dir, repeat=1):
+    """Run one case, best of repeat runs; called in a fresh worker process"""
+    result = {'name': case['name'], 'benchmark': case['benchmark'], 'ok': False, 'error': None}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # The editor logs every step
+            runs = [BENCHMARKS[case['benchmark']](data_dir, *case['args']) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run['seconds'])
+        result.update(best)
+        result['runs'] = [run['seconds'] for run in runs]
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def run_benchmarks(cases, data_dir, repeat=1):
+    """Run every case in its own process, printing one line per case"""
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for case in cases:
+        # A new process per case, so peak RSS is not inherited from earlier cases
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, case, data_dir, repeat).result()
+        results.append(result)
+        if result['ok']:
+            rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else "n/a"
+            copied = ""
+            if 'bytes_copied_per_page' in result:
+                copied = f"  copied {result['bytes_copied_per_page'] / (1024 * 1024):.1f} MB/page"
+            print(f"{result['name']:<40} {result['seconds']:9.3f}s  peak RSS {rss}{copied}")
+        else:
+            print(f"{result['name']:<40} FAILED: {result['error']}")
+    return results
+
+def environment_info():
+    """Details that make results comparable, stored alongside them"""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pymupdf': fitz.VersionBind,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare_results(results, baseline, threshold):
+    """Print each case against the baseline; returns the names of regressed cases"""
+    baseline_by_name = {r['name']: r for r in baseline.get('results', []) if r.get('ok')}
+    regressions = []
+    print(f"\n{'case':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for result in results:
+        before = baseline_by_name.get(result['name'])
+        if not result['ok'] or before is None:
+            print(f"{result['name']:<40} {'-':>10} {'-':>10}   (not comparable)")
+            continue
+        change = result['seconds'] / before['seconds'] - 1 if before['seconds'] > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(result['name'])
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{result['name']:<40} {before['seconds']:9.3f}s {result['seconds']:9.3f}s "
+              f"{change:+7.1%}{flag}")
+    print(f"\n{len(regressions)} regression(s) beyond {threshold:.0%}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark merging, saving and rendering on synthetic PDFs.")
+    parser.add_argument('--pages', type=int, nargs='+', default=DEFAULT_PAGES,
+                        help=f"Document sizes in pages (default: {' '.join(map(str, DEFAULT_PAGES))})")
+    parser.add_argument('--overlays', type=int, nargs='+', default=DEFAULT_OVERLAYS,
+                        help=f"Overlay counts for the save benchmark (default: {' '.join(map(str, DEFAULT_OVERLAYS))})")
+    parser.add_argument('--zooms', type=float, nargs='+', default=DEFAULT_ZOOMS,
+                        help=f"Zoom levels for the render benchmark (default: {' '.join(map(str, DEFAULT_ZOOMS))})")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS),
+                        help="Run only these benchmarks")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per case; the fastest is reported (default: 1)")
+    parser.add_argument('-o', '--output', help="Write results as JSON to this path")
+    parser.add_argument('--compare', help="Compare against a results file written earlier with -o")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Slowdown counted as a regression, as a fraction (default: 0.10)")
+    parser.add_argument('--data-dir', help="Keep generated documents here and reuse them (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot read baseline: {e}")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="meshpdf_bench_")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        cases = plan_cases(args.pages, args.overlays, args.zooms, args.only)
+        prepare_documents(data_dir, cases)
+        results = run_benchmarks(cases, data_dir, max(1, args.repeat))
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': environment_info(), 'results': results}, f, indent=2)
+
+    failed = [r for r in results if not r['ok']]
+    regressions = compare_results(results, baseline, args.threshold) if baseline else []
+    return 1 if failed or regressions else 0
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()  # Needed for process pools in frozen Windows builds
+    sys.exit(main())
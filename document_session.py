@@ -0,0 +1,61 @@
+import threading
+from pdf_editor import open_pdf
+from render_cache import document_key
+
+class DocumentSession:
+    """One open PDF, shared by the viewer, its render workers, saving and printing"""
+    # The thread that creates the session uses `document`, parsed once here. fitz
+    # documents must not be used from several threads, so every other thread gets
+    # its own clone from thread_document(), opened on first use and kept until that
+    # thread releases it (PageRenderer.release_document() makes the render threads
+    # do so); clones of in-memory sources share the bytes. Saving and
+    # printing change the document they work on, so they take a private copy().
+    def __init__(self, source):
+        self.source = source  # File path, or bytes for an unsaved merge
+        self.key = document_key(source)  # Path, modification time and size when opened
+        self.document = open_pdf(source)
+        self.page_count = len(self.document)
+        self.owner_thread = threading.get_ident()
+        self._page_rects = None
+        self._local = threading.local()
+
+    def page_rects(self):
+        """Rectangle of every page in points, loaded once"""
+        if self._page_rects is None:
+            self._page_rects = [self.document[page_num].rect for page_num in range(self.page_count)]
+        return self._page_rects
+
+    def thread_document(self):
+        """Document for the calling thread: the shared one on the owner thread, else a clone"""
+        if threading.get_ident() == self.owner_thread:
+            return self.document
+        doc = getattr(self._local, 'document', None)
+        if doc is None:
+            doc = open_pdf(self.source)
+            self._local.document = doc
+        return doc
+
+    def release_thread_document(self):
+        """Close the calling thread's clone, if it has one"""
+        doc = getattr(self._local, 'document', None)
+        if doc is not None:
+            doc.close()
+            self._local.document = None
+
+    def copy(self):
+        """A private document to modify, e.g. to apply overlays for saving or printing"""
+        return open_pdf(self.source)
+
+    def changed_on_disk(self):
+        """True if the file was replaced or modified since the session opened it"""
+        if isinstance(self.source, (bytes, bytearray)):
+            return False
+        return document_key(self.source) != self.key
+
+    def close(self):
+        """Close the shared document; clones must have been released by their threads"""
+        if not self.document.is_closed:
+            self.document.close()
+
+# Export class
+__all__ = ['DocumentSession']
@@ -0,0 +1,29 @@
+import importlib
+
+# Heavy modules used by the GUI, loaded on first use so that startup stays fast:
+#
+#     from lazy_import import fitz
+#     ...
+#     doc = fitz.open(path)  # PyMuPDF is imported here, the first time
+#
+# Each attribute is looked up on the real module once and then kept on the
+# stand-in, so later accesses cost no more than on the module itself.
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access"""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        # Only called for attributes not kept on the stand-in yet
+        value = getattr(importlib.import_module(self._name), attribute)
+        setattr(self, attribute, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+fitz = LazyModule('fitz')  # PyMuPDF
+
+# Export class and modules
+__all__ = ['LazyModule', 'fitz']
@@ -1,14 +1,26 @@
 import sys
-import tempfile
+
+# --profile-startup: time every import below and how long the first window takes to appear
+if '--profile-startup' in sys.argv:
+    from startup_profile import StartupProfiler
+    startup_profiler = StartupProfiler()
+    startup_profiler.install()
+else:
+    startup_profiler = None
+
 import os
 
+# Heavy modules (PyMuPDF, print support, process pools) are imported on first use
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QHBoxLayout, QPushButton, QFileDialog,
-                            QMessageBox)
-from PyQt6.QtCore import Qt
-from pdf_viewer import PDFViewer, DraggableLabel
+                            QMessageBox, QProgressDialog)
+from PyQt6.QtCore import Qt, QTimer
+from pdf_viewer import PDFViewer
 from pdf_editor import PDFEditor
+from document_session import DocumentSession
+from background_tasks import BackgroundTask
 from signature_pad import SignaturePad
+import tracing
 
 class MeshPDFApp(QMainWindow):
     def __init__(self):
@@ -105,9 +117,15 @@ class MeshPDFApp(QMainWindow):
         self.pdf_editor = PDFEditor()
         layout.addWidget(self.pdf_viewer)
         
-        # Initialize current file path and temp files list
+        # Current document: a file path, or bytes for an unsaved merge
         self.current_file = None
-        self.temp_files = []
+        self.temp_files = []  # Spool files of large merges
+        self.merge_task = None
+        self.merge_progress = None
+        self.save_task = None
+        self.save_progress = None
+        self.saving_copy = False  # The running save copies the original without overlays
+        self.close_after_save = False  # Close the window once the running save succeeds
         
     def update_zoom_label(self, zoom_level):
         """Update the zoom percentage label"""
@@ -118,13 +136,13 @@ class MeshPDFApp(QMainWindow):
             self, "Open PDF File", "", "PDF Files (*.pdf)")
         if file_path:
             try:
-                # Clean up temp files
-                self.cleanup_temp_files()
-                
                 self.current_file = file_path
+                # Parsed once; the viewer, its render workers, saving and printing share it
+                session = DocumentSession(file_path)
                 # Pass scale factor to editor
-                self.pdf_editor.set_current_pdf(file_path, scale_factor=self.pdf_viewer.scale_factor)
-                self.pdf_viewer.load_pdf(file_path, preserve_overlays=False)  # No overlays to preserve on initial load
+                self.pdf_editor.set_current_pdf(file_path, scale_factor=self.pdf_viewer.scale_factor, session=session)
+                self.pdf_viewer.load_pdf(session, preserve_overlays=False)  # No overlays to preserve on initial load
+                self.cleanup_temp_files()  # The previous document, and any spool file, is closed now
                 
                 # Enable buttons after successful load
                 self.enable_editing_buttons(True)
@@ -145,110 +163,152 @@ class MeshPDFApp(QMainWindow):
         self.zoom_reset_btn.setEnabled(enabled)
             
     def save_pdf(self):
-        if not self.current_file:
+        """Ask where to save and start saving in the background; returns True if saving started"""
+        if self.current_file is None:
             QMessageBox.warning(self, "No PDF", "Please open a PDF file first.")
-            return
+            return False
+        if self.save_task is not None:
+            return False  # Already saving
             
         save_path, _ = QFileDialog.getSaveFileName(
             self, "Save PDF File", "", "PDF Files (*.pdf)")
-        if save_path:
-            try:
-                print("Collecting modifications...")
-                # Collect all modifications
-                modifications = []
-                for page_num, page_label in enumerate(self.pdf_viewer.page_labels):
-                    for child in page_label.children():
-                        if isinstance(child, DraggableLabel) and hasattr(child, 'modification_info'):
-                            mod_info = child.modification_info
-                            
-                            # Create modification entry with actual widget data
-                            modification = {
-                                'type': mod_info['type'],
-                                'page': mod_info['page'],
-                                'position': child.pos(),
-                            }
-                            
-                            if mod_info['type'] == 'signature':
-                                modification['size'] = child.size()
-                                modification['image'] = child.pixmap()
-                            elif mod_info['type'] == 'text':
-                                modification['text'] = child.text()
-                                modification['font_size'] = child.font().pointSize()
-                            
-                            modifications.append(modification)
-                            print(f"Added {mod_info['type']} modification on page {mod_info['page']}")
-                
-                # If no modifications, offer to save as copy
-                if not modifications:
-                    reply = QMessageBox.question(
-                        self, "No Modifications",
-                        "No modifications found. Do you want to save a copy of the original PDF?",
-                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
-                    )
-                    if reply == QMessageBox.StandardButton.Yes:
-                        # Save copy of original
-                        import shutil
-                        shutil.copy2(self.current_file, save_path)
-                        QMessageBox.information(self, "Success", "PDF copy saved successfully!")
-                    return
-                
-                print(f"Total modifications to apply: {len(modifications)}")
-                
-                # Clear previous modifications in editor
-                self.pdf_editor.modifications = []
-                
-                # Apply modifications accounting for zoom
-                for mod in modifications:
-                    if mod['type'] == 'signature':
-                        self.pdf_editor.add_signature(
-                            mod['image'], 
-                            mod['page'], 
-                            mod['position'], 
-                            mod['size'],
-                            zoom_level=self.pdf_viewer.zoom_level
-                        )
-                    elif mod['type'] == 'text':
-                        self.pdf_editor.add_text(
-                            mod['text'], 
-                            mod['page'], 
-                            mod['position'], 
-                            mod.get('font_size', 14),
-                            zoom_level=self.pdf_viewer.zoom_level
-                        )
-                
-                # Save the PDF
-                success = self.pdf_editor.save_pdf(save_path)
-                if success:
-                    QMessageBox.information(self, "Success", "PDF saved successfully!")
-                    print(f"PDF saved successfully to: {save_path}")
-                else:
-                    QMessageBox.critical(self, "Error", "Failed to save PDF. Please check console for details.")
-                    
-            except Exception as e:
-                error_msg = f"Error saving PDF: {str(e)}"
-                QMessageBox.critical(self, "Error", error_msg)
-                print(error_msg)
-                import traceback
-                traceback.print_exc()
+        if not save_path:
+            return False
+        session = self.pdf_viewer.session
+        if session is not None and session.changed_on_disk():
+            QMessageBox.warning(self, "File Changed",
+                                "The PDF was changed by another program since it was opened.\n"
+                                "Open it again before saving, so your changes are placed on the current pages.")
+            return False
+        
+        try:
+            print("Collecting modifications...")
+            # Clear previous modifications in editor
+            self.pdf_editor.modifications = []
+            
+            # Add every overlay, converted to PDF coordinates accounting for zoom
+            modification_count = self.pdf_viewer.apply_overlays(self.pdf_editor)
+        except Exception as e:
+            error_msg = f"Error saving PDF: {str(e)}"
+            QMessageBox.critical(self, "Error", error_msg)
+            print(error_msg)
+            import traceback
+            traceback.print_exc()
+            return False
+        
+        # If no modifications, offer to save as copy
+        if not modification_count:
+            reply = QMessageBox.question(
+                self, "No Modifications",
+                "No modifications found. Do you want to save a copy of the original PDF?",
+                QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+            )
+            if reply != QMessageBox.StandardButton.Yes:
+                return False
+        else:
+            print(f"Total modifications to apply: {modification_count}")
+        
+        # Save on a worker thread so the window stays responsive. The editor writes a
+        # temp file next to save_path and only replaces save_path once it is complete,
+        # so cancelling or a crash leaves any existing file there untouched.
+        self.save_progress = QProgressDialog("Saving PDF...", "Cancel", 0, 0, self)
+        self.save_progress.setWindowTitle("Save PDF")
+        self.save_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.save_progress.setMinimumDuration(0)
+        self.save_progress.setAutoReset(False)
+        self.save_progress.setValue(0)
+        
+        # Also writes out an unsaved merge when saving a copy
+        self.saving_copy = not modification_count
+        self.save_task = BackgroundTask(self.pdf_editor.save_pdf, save_path)
+        self.save_task.progress.connect(self.on_save_progress)
+        self.save_task.finished.connect(self.on_save_finished)
+        self.save_task.failed.connect(self.on_save_failed)
+        self.save_progress.canceled.connect(self.save_task.cancel)
+        self.save_btn.setEnabled(False)
+        self.save_task.start()
+        return True
+    
+    def on_save_progress(self, done, total, message):
+        """Update the save progress dialog"""
+        dialog = self.save_progress
+        if dialog is not None and not self.save_task.is_cancelled():
+            dialog.setLabelText(message)
+            dialog.setMaximum(total)
+            dialog.setValue(done)  # Processes events while modal, so the save may finish here
+    
+    def finish_save(self):
+        """Close the save progress dialog"""
+        if self.save_progress is not None:
+            self.save_progress.close()
+            self.save_progress = None
+        self.save_task = None
+        self.save_btn.setEnabled(self.current_file is not None)
+    
+    def on_save_failed(self, error):
+        """Report a save that raised"""
+        self.finish_save()
+        self.close_after_save = False
+        QMessageBox.critical(self, "Error", f"Failed to save PDF: {error}")
+        print(f"Save error: {error}")
+    
+    def on_save_finished(self, success):
+        """Report the outcome of a save: True, False on failure, or None if cancelled"""
+        self.finish_save()
+        if success is None:
+            self.close_after_save = False
+            print("Save cancelled")
+            return
+        if not success:
+            self.close_after_save = False
+            QMessageBox.critical(self, "Error", "Failed to save PDF. Please check console for details.")
+            return
+        
+        if not self.saving_copy:
+            self.pdf_viewer.overlay_model.mark_saved()
+        if self.close_after_save:
+            self.close()
+            return
+        if self.pdf_editor.replaced_source:
+            self.reopen_saved_file()
+        QMessageBox.information(self, "Success", "PDF copy saved successfully!" if self.saving_copy
+                                else "PDF saved successfully!")
+    
+    def reopen_saved_file(self):
+        """Show the file just saved over the open one; its overlays are part of the pages now"""
+        # Otherwise the next save would add the same overlays again, and render threads
+        # opening the new file would draw them twice
+        scroll = self.pdf_viewer.verticalScrollBar().value()
+        try:
+            session = DocumentSession(self.current_file)
+            self.pdf_editor.set_current_pdf(self.current_file, scale_factor=self.pdf_viewer.scale_factor,
+                                            session=session)
+            self.pdf_viewer.load_pdf(session, preserve_overlays=False)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"The PDF was saved, but could not be opened again: {str(e)}")
+            print(f"Error reopening PDF: {str(e)}")
+            return
+        # Keep the reader's place once the new pages are laid out
+        QTimer.singleShot(0, lambda: self.pdf_viewer.verticalScrollBar().setValue(scroll))
             
     def print_pdf(self):
-        if self.current_file:
+        if self.current_file is not None:
             self.pdf_viewer.print_pdf()
         else:
             QMessageBox.warning(self, "No PDF", "Please open a PDF file first.")
             
     def add_signature(self):
-        if not self.current_file:
+        if self.current_file is None:
             QMessageBox.warning(self, "No PDF", "Please open a PDF file first.")
             return
             
         signature_pad = SignaturePad(self)
         if signature_pad.exec():
             signature_image = signature_pad.get_signature()
-            self.pdf_viewer.enable_signature_mode(signature_image)
+            self.pdf_viewer.enable_signature_mode(signature_image, signature_pad.get_strokes())
             
     def add_text(self):
-        if not self.current_file:
+        if self.current_file is None:
             QMessageBox.warning(self, "No PDF", "Please open a PDF file first.")
             return
             
@@ -295,12 +355,7 @@ class MeshPDFApp(QMainWindow):
             return
         
         # Check for unsaved changes
-        has_mods = any(
-            isinstance(child, DraggableLabel) and hasattr(child, 'modification_info')
-            for page_label in self.pdf_viewer.page_labels
-            for child in page_label.children()
-        )
-        if has_mods:
+        if self.pdf_viewer.overlay_model.has_unsaved_changes():
             reply = QMessageBox.question(
                 self, "Unsaved Changes",
                 "Current PDF has unsaved modifications. Combining will discard them. Continue?",
@@ -309,52 +364,114 @@ class MeshPDFApp(QMainWindow):
             if reply == QMessageBox.StandardButton.No:
                 return
         
+        # Merge on a worker thread so the window stays responsive
+        self.merge_progress = QProgressDialog("Combining PDFs...", "Cancel", 0, len(files), self)
+        self.merge_progress.setWindowTitle("Combine PDFs")
+        self.merge_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.merge_progress.setMinimumDuration(0)
+        self.merge_progress.setAutoReset(False)
+        self.merge_progress.setValue(0)
+        
+        self.merge_task = BackgroundTask(self.pdf_editor.merge_pdfs, files)
+        self.merge_task.progress.connect(self.on_merge_progress)
+        self.merge_task.finished.connect(self.on_merge_finished)
+        self.merge_task.failed.connect(self.on_merge_failed)
+        self.merge_progress.canceled.connect(self.merge_task.cancel)
+        self.combine_btn.setEnabled(False)
+        self.merge_task.start()
+    
+    def on_merge_progress(self, done, total, message):
+        """Update the combine progress dialog"""
+        dialog = self.merge_progress
+        if dialog is not None and not self.merge_task.is_cancelled():
+            if done:
+                dialog.setLabelText(f"Combined {done} of {total} files\n{message}")
+            else:
+                dialog.setLabelText(message)  # Still checking the input files
+            dialog.setMaximum(total)
+            dialog.setValue(done)  # Processes events while modal, so the merge may finish here
+    
+    def finish_merge(self):
+        """Close the combine progress dialog"""
+        if self.merge_progress is not None:
+            self.merge_progress.close()
+            self.merge_progress = None
+        self.merge_task = None
+        self.combine_btn.setEnabled(True)
+    
+    def on_merge_failed(self, error):
+        """Report a merge that raised"""
+        self.finish_merge()
+        QMessageBox.critical(self, "Error", f"Failed to combine PDFs: {error}")
+        print(f"Combine error: {error}")
+    
+    def on_merge_finished(self, merged):
+        """Open the merged document: bytes, or a spool file path for large merges"""
+        cancelled = self.merge_task.is_cancelled()
+        self.finish_merge()
+        report = self.pdf_editor.last_merge_report or {}
+        if report.get('cancelled') or (cancelled and not merged):
+            print("Combine cancelled")
+            return
+        
+        skipped = "".join(f"\n• {name}: {reason}" for name, reason in report.get('skipped', []))
         try:
-            # Clean up previous temp files
-            self.cleanup_temp_files()
+            if not merged:
+                raise Exception("Merge failed - no valid PDFs could be combined" + skipped)
             
-            merged_path = self.pdf_editor.merge_pdfs(files)
-            if merged_path:
-                self.current_file = merged_path
-                self.temp_files.append(merged_path)  # Track temp file
-                self.pdf_editor.set_current_pdf(merged_path, scale_factor=self.pdf_viewer.scale_factor)
-                self.pdf_viewer.load_pdf(merged_path, preserve_overlays=False)  # No overlays to preserve for merged PDF
-                
-                # Enable buttons
-                self.enable_editing_buttons(True)
-                
-                QMessageBox.information(self, "Success", 
-                    f"Combined {len(files)} PDFs successfully!\nYou can now edit, save, or print the combined PDF.")
-            else:
-                raise Exception("Merge failed - no valid PDFs could be combined")
+            if isinstance(merged, str):
+                self.temp_files.append(merged)  # Track spool file
+            self.current_file = merged
+            session = DocumentSession(merged)
+            self.pdf_editor.set_current_pdf(merged, scale_factor=self.pdf_viewer.scale_factor, session=session)
+            self.pdf_viewer.load_pdf(session, preserve_overlays=False)  # No overlays to preserve for merged PDF
+            self.cleanup_temp_files(keep=[merged])  # Spool files of previous merges are closed now
+            
+            # Enable buttons
+            self.enable_editing_buttons(True)
+            
+            merged_count = len(report.get('merged', []))
+            message = (f"Combined {merged_count} PDFs ({report.get('total_pages', 0)} pages) successfully!\n"
+                       f"You can now edit, save, or print the combined PDF.")
+            if skipped:
+                message += f"\n\nSkipped {len(report['skipped'])} files:{skipped}"
+            if report.get('dedup_objects'):
+                message += (f"\n\nShared {report['dedup_objects']} duplicate fonts and images "
+                            f"({report['dedup_bytes'] / (1024 * 1024):.1f} MB saved)")
+            if report.get('repaired'):
+                message += f"\n\nRepaired damaged files: {', '.join(report['repaired'])}"
+            if len(report.get('page_sizes', {})) > 1:
+                sizes = ", ".join(f"{size} pt ({count})" for size, count in
+                                  sorted(report['page_sizes'].items(), key=lambda item: -item[1]))
+                message += f"\n\nMixed page sizes: {sizes}"
+            QMessageBox.information(self, "Success", message)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to combine PDFs: {str(e)}")
             print(f"Combine error: {str(e)}")
     
-    def cleanup_temp_files(self):
-        """Clean up all temporary files"""
+    def cleanup_temp_files(self, keep=()):
+        """Clean up all temporary files except those in keep; they must be closed first"""
         for temp_file in self.temp_files:
-            if os.path.exists(temp_file):
+            if temp_file not in keep and os.path.exists(temp_file):
                 try:
                     os.remove(temp_file)
                     print(f"Cleaned up temp file: {temp_file}")
-                except:
-                    pass
-        self.temp_files.clear()
+                except OSError as e:
+                    print(f"Could not remove temp file {temp_file}: {e}")
+        self.temp_files = [temp_file for temp_file in self.temp_files if temp_file in keep]
     
     def has_unsaved_changes(self):
         """Check if there are unsaved modifications"""
-        if not self.pdf_viewer.page_labels:
-            return False
-            
-        for page_label in self.pdf_viewer.page_labels:
-            for child in page_label.children():
-                if isinstance(child, DraggableLabel) and hasattr(child, 'modification_info'):
-                    return True
-        return False
+        return self.pdf_viewer.overlay_model.has_unsaved_changes()
     
     def closeEvent(self, event):
         """Handle application close with unsaved changes check"""
+        if self.save_task is not None:
+            # Let the running save finish; the window closes once it succeeds
+            self.close_after_save = True
+            event.ignore()
+            return
+        
         if self.has_unsaved_changes():
             reply = QMessageBox.question(
                 self, 
@@ -367,10 +484,12 @@ class MeshPDFApp(QMainWindow):
             )
             
             if reply == QMessageBox.StandardButton.Save:
-                # Try to save the document
-                self.save_pdf()
-                # If save was successful or cancelled, check if we should still close
-                # Note: save_pdf doesn't return success status, so we assume user completed save
+                # Saving runs in the background; the window closes once it succeeds,
+                # and stays open if it fails or no destination was chosen
+                if self.save_pdf():
+                    self.close_after_save = True
+                event.ignore()
+                return
                 
             elif reply == QMessageBox.StandardButton.Cancel:
                 # User cancelled, don't close
@@ -378,16 +497,51 @@ class MeshPDFApp(QMainWindow):
                 return
             # If Discard was selected, continue with closing
         
-        # Clean up temporary files and close
+        # Stop a running merge and clean up temporary files
+        if self.merge_task is not None:
+            self.merge_task.cancel()
+        self.pdf_viewer.clear_pages()  # Release the spool file before removing it
         self.cleanup_temp_files()
         super().closeEvent(event)
 
 # Import QLabel for zoom label
 from PyQt6.QtWidgets import QLabel
 
+def report_startup():
+    """Print the --profile-startup report once the event loop is running"""
+    startup_profiler.mark("event loop running")
+    startup_profiler.uninstall()
+    startup_profiler.report()
+
+def trace_path_from_arguments(argv):
+    """Output file given with --trace PATH or --trace=PATH, or None"""
+    for index, arg in enumerate(argv):
+        if arg.startswith('--trace='):
+            return arg.split('=', 1)[1]
+        if arg == '--trace' and index + 1 < len(argv):
+            return argv[index + 1]
+    return None
+
 if __name__ == '__main__':
+    # --trace PATH (or MESHPDF_TRACE=PATH) records timing spans and writes them on exit:
+    # JSON lines for a .jsonl path, otherwise a Chrome trace
+    trace_path = trace_path_from_arguments(sys.argv)
+    if trace_path:
+        tracing.enable(trace_path)
+    else:
+        tracing.enable_from_environment()
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()  # Needed for process pools in frozen Windows builds
+    if startup_profiler is not None:
+        startup_profiler.mark("imports done")
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     window = MeshPDFApp()
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    if startup_profiler is not None:
+        startup_profiler.mark("first window shown")
+        QTimer.singleShot(0, report_startup)
+    exit_code = app.exec()
+    tracing.export()
+    sys.exit(exit_code)
\ No newline at end of file
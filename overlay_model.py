@@ -0,0 +1,96 @@
+import itertools
+
+class Overlay:
+    """A signature or text overlay; coordinates are PDF points from the page's top-left corner"""
+    # Stored in page space so zooming never touches them; the viewer projects them to
+    # pixels when laying out the labels, and saving uses them as they are.
+    __slots__ = ('id', 'type', 'page', 'x', 'y', 'width', 'height', 'pixmap', 'strokes', 'text',
+                 'font_size')
+
+    def __init__(self, type, page, x, y, width=0.0, height=0.0, pixmap=None, strokes=None, text='',
+                 font_size=14.0):
+        self.id = None  # Assigned by OverlayModel.add
+        self.type = type  # 'signature' or 'text'
+        self.page = page
+        self.x = x
+        self.y = y
+        self.width = width  # Signature box; text is sized by its font
+        self.height = height
+        self.pixmap = pixmap  # Full-resolution signature QPixmap
+        self.strokes = strokes  # Signature pen strokes from SignaturePad.get_strokes, if recorded
+        self.text = text
+        self.font_size = font_size
+
+    def rect(self):
+        """Signature box as (x0, y0, x1, y1) in PDF points"""
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+
+    def __repr__(self):
+        return f"Overlay({self.type!r}, page={self.page}, x={self.x:.1f}, y={self.y:.1f})"
+
+class OverlayModel:
+    """Document-level store of signature and text overlays, indexed by page"""
+    # Widgets on the pages are only views of the Overlay records. revision counts user
+    # changes, so checking for unsaved work is a comparison rather than a walk over
+    # every page's widgets.
+    def __init__(self):
+        self.pages = {}  # page number -> overlays on that page, in stacking order
+        self.count = 0
+        self.revision = 0  # Bumped on every change that needs saving
+        self.saved_revision = 0
+        self.ids = itertools.count(1)
+
+    def add(self, overlay):
+        """Add an overlay, assigning it an id; returns the overlay"""
+        overlay.id = next(self.ids)
+        self.pages.setdefault(overlay.page, []).append(overlay)
+        self.count += 1
+        self.revision += 1
+        return overlay
+
+    def remove(self, overlay):
+        """Remove an overlay"""
+        page_overlays = self.pages.get(overlay.page, [])
+        if overlay not in page_overlays:
+            return
+        page_overlays.remove(overlay)
+        if not page_overlays:
+            del self.pages[overlay.page]
+        self.count -= 1
+        self.revision += 1
+
+    def update(self, overlay, **changes):
+        """Change fields of an overlay, e.g. its position after a drag"""
+        for name, value in changes.items():
+            setattr(overlay, name, value)
+        self.revision += 1
+
+    def clear(self):
+        """Remove all overlays, e.g. when another document is opened"""
+        self.pages.clear()
+        self.count = 0
+        self.revision = 0
+        self.saved_revision = 0
+
+    def page_overlays(self, page_num):
+        """Overlays on one page"""
+        return self.pages.get(page_num, [])
+
+    def overlays(self):
+        """All overlays, page by page; pages without overlays are never visited"""
+        for page_num in sorted(self.pages):
+            yield from self.pages[page_num]
+
+    def has_unsaved_changes(self):
+        """True if there are overlays that changed since the last save"""
+        return self.count > 0 and self.revision != self.saved_revision
+
+    def mark_saved(self):
+        """Record that the current overlays have been saved"""
+        self.saved_revision = self.revision
+
+    def __len__(self):
+        return self.count
+
+# Export classes
+__all__ = ['Overlay', 'OverlayModel']
@@ -0,0 +1,210 @@
+from PyQt6.QtCore import QObject, QCoreApplication, pyqtSignal
+from PyQt6.QtGui import QImage
+import itertools
+import os
+import queue
+import threading
+import traceback
+import tracing
+from lazy_import import fitz  # PyMuPDF
+
+# Render passes, in the order the workers pick them up
+RELEASE_PASS = -1  # Close the thread's document clone; see release_document()
+PREVIEW_PASS = 0
+FINAL_PASS = 1
+TILE_PASS = 2
+SHUTDOWN_PASS = 3
+
+# Pixel format of the images handed to the GUI thread. It is the raster paint
+# engine's native opaque format, so QPixmap.fromImage shares the image's pixels
+# instead of converting them again.
+DISPLAY_FORMAT = QImage.Format.Format_RGB32
+
+def qimage_from_pixmap(pix, image_format=DISPLAY_FORMAT):
+    """Copy a fitz.Pixmap into a QImage that owns its pixels, in image_format"""
+    # The wrapper over pix.samples_mv borrows fitz's buffer without copying, so it is
+    # only valid while pix is alive; convertToFormat reads it once and returns an
+    # image with its own memory. This is the only copy between rasterizer and screen.
+    source_format = QImage.Format.Format_RGBA8888_Premultiplied if pix.alpha else QImage.Format.Format_RGB888
+    borrowed = QImage(pix.samples_mv, pix.width, pix.height, pix.stride, source_format)
+    if image_format == source_format:
+        return borrowed.copy()
+    return borrowed.convertToFormat(image_format)
+
+class RenderJob:
+    """A single page rasterization request"""
+    def __init__(self, generation, session, page_num, scale, render_scale, final, tile=None, clip=None):
+        self.generation = generation
+        self.session = session  # DocumentSession of the page
+        self.page_num = page_num
+        self.scale = scale  # Scale the page was requested at
+        self.render_scale = render_scale  # Scale actually rasterized in this pass
+        self.final = final
+        self.tile = tile  # (column, row) for tile jobs, None for whole pages
+        self.clip = clip  # Page-space rectangle rendered by a tile job
+
+class PageRenderer(QObject):
+    """Background page rasterizer with a quick preview pass and a full-resolution pass"""
+    # Each worker thread renders from its own clone of the DocumentSession's
+    # document, opened once per session; documents are not thread-safe.
+    # page number, target scale, final (False for the preview pass), image
+    page_rendered = pyqtSignal(int, float, bool, QImage)
+    # page number, scale, tile column, tile row, image
+    tile_rendered = pyqtSignal(int, float, int, int, QImage)
+
+    # Internal: emitted from worker threads, relayed on the GUI thread
+    _job_finished = pyqtSignal(int, int, float, bool, int, int, QImage)
+
+    def __init__(self, worker_count=None, preview_ratio=0.25):
+        super().__init__()
+        if worker_count is None:
+            worker_count = max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.worker_count = worker_count
+        self.preview_ratio = preview_ratio  # Preview resolution relative to the final one
+
+        self.session = None
+        self.generation = 0  # Bumped whenever outstanding jobs become stale
+        self.jobs = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.discarded = set()  # Pages no longer wanted; their queued jobs are skipped
+        self.workers = []
+
+        self._job_finished.connect(self._on_job_finished)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def set_document(self, session):
+        """Switch to a new DocumentSession, cancelling all outstanding jobs"""
+        self.cancel()
+        self.session = session
+
+    def request(self, page_num, scale, preview=True):
+        """Queue a full-resolution render of a page, preceded by a preview pass"""
+        if self.session is None:
+            return
+        self._start_workers()
+        self.discarded.discard(page_num)
+        passes = [(FINAL_PASS, scale)]
+        if preview:
+            passes.insert(0, (PREVIEW_PASS, scale * self.preview_ratio))
+        for render_pass, render_scale in passes:
+            job = RenderJob(self.generation, self.session, page_num, scale, render_scale,
+                            render_pass == FINAL_PASS)
+            self.jobs.put((render_pass, next(self.sequence), job))
+
+    def request_tile(self, page_num, scale, tile, clip):
+        """Queue a render of one tile of a page; clip is the tile's page-space rectangle"""
+        if self.session is None:
+            return
+        self._start_workers()
+        self.discarded.discard(page_num)
+        job = RenderJob(self.generation, self.session, page_num, scale, scale, True, tile=tile, clip=clip)
+        self.jobs.put((TILE_PASS, next(self.sequence), job))
+
+    def discard(self, page_num):
+        """Skip queued jobs for a page that scrolled out of view"""
+        self.discarded.add(page_num)
+
+    def cancel(self):
+        """Drop all queued jobs and ignore results of jobs already running"""
+        self.generation += 1
+        self.discarded.clear()
+        try:
+            while True:
+                self.jobs.get_nowait()
+        except queue.Empty:
+            pass
+
+    def release_document(self, timeout=5):
+        """Cancel all jobs and wait until every worker has closed its clone of the document"""
+        # Each worker takes one barrier from the queue, closes its clone and waits
+        # there, so it cannot take a second one; the barrier opens when all workers
+        # and the caller have arrived. Afterwards no thread holds the file open.
+        self.cancel()
+        self.session = None
+        if not self.workers:
+            return
+        barrier = threading.Barrier(len(self.workers) + 1)
+        for _ in self.workers:
+            self.jobs.put((RELEASE_PASS, next(self.sequence), barrier))
+        try:
+            barrier.wait(timeout)
+        except threading.BrokenBarrierError:
+            print("Render workers did not release the document in time")
+
+    def shutdown(self):
+        """Stop all worker threads"""
+        self.cancel()
+        for _ in self.workers:
+            # Sorts after every real job priority, so workers finish first
+            self.jobs.put((SHUTDOWN_PASS, next(self.sequence), None))
+        for worker in self.workers:
+            worker.join(timeout=5)
+        self.workers.clear()
+
+    def _start_workers(self):
+        """Start the worker threads on first use"""
+        while len(self.workers) < self.worker_count:
+            worker = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"meshpdf-render-{len(self.workers)}")
+            worker.start()
+            self.workers.append(worker)
+
+    def _worker_loop(self):
+        """Worker thread: render jobs with a thread-private document"""
+        session = None  # Session whose clone this thread holds
+        try:
+            while True:
+                _, _, job = self.jobs.get()
+                if job is None:
+                    break
+                if isinstance(job, threading.Barrier):
+                    if session is not None:
+                        session.release_thread_document()
+                        session = None
+                    try:
+                        job.wait()
+                    except threading.BrokenBarrierError:
+                        pass  # The caller stopped waiting
+                    continue
+                if job.generation != self.generation or job.page_num in self.discarded:
+                    continue  # Cancelled while queued
+
+                with tracing.span('render page', page=job.page_num, scale=job.render_scale,
+                                  final=job.final, tile=job.tile):
+                    try:
+                        if session is not job.session:
+                            if session is not None:
+                                session.release_thread_document()
+                            session = job.session
+                        doc = session.thread_document()
+
+                        pix = doc[job.page_num].get_pixmap(
+                            matrix=fitz.Matrix(job.render_scale, job.render_scale), clip=job.clip)
+                        image = qimage_from_pixmap(pix)
+                        del pix
+                    except Exception as e:
+                        print(f"Error rendering page {job.page_num}: {str(e)}")
+                        traceback.print_exc()
+                        continue
+
+                if job.generation == self.generation:
+                    column, row = job.tile if job.tile is not None else (-1, -1)
+                    self._job_finished.emit(job.generation, job.page_num, job.scale,
+                                            job.final, column, row, image)
+        finally:
+            if session is not None:
+                session.release_thread_document()
+
+    def _on_job_finished(self, generation, page_num, scale, final, column, row, image):
+        """GUI thread: forward results that are still current"""
+        if generation != self.generation:
+            return
+        if column < 0:
+            self.page_rendered.emit(page_num, scale, final, image)
+        else:
+            self.tile_rendered.emit(page_num, scale, column, row, image)
+
+# Export classes and functions
+__all__ = ['PageRenderer', 'qimage_from_pixmap', 'DISPLAY_FORMAT']
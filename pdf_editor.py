@@ -1,24 +1,109 @@
-from PyQt6.QtCore import QPointF, QPoint, Qt
 from PyQt6.QtGui import QPixmap, QImage
-import fitz  # PyMuPDF
 import os
-import io
-from PIL import Image
-import numpy as np
 import traceback
 import tempfile
 import shutil
+import time
+import hashlib
+import json
+import re
+import tracing
+# fitz (PyMuPDF) is imported on first use and the process pool modules where they
+# are used, so that loading this module does not slow down application startup
+from lazy_import import fitz
+
+# Indirect object reference, e.g. "12 0 R"
+_OBJECT_REF = re.compile(r'(\d+) 0 R\b')
+# Non-stream objects that are shared between merged inputs when identical
+_DEDUP_TYPE_KEY = re.compile(r'/Type\s*/(?:Font|FontDescriptor|ExtGState)\b')
+# A page's /Contents entry: one stream reference or an array of them
+_PAGE_CONTENTS = re.compile(r'/Contents\s*(\[[^\]]*\]|\d+ 0 R)')
+
+def open_pdf(source):
+    """Open a PDF from a file path or from in-memory bytes"""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def replace_file(temp_path, output_path):
+    """Flush a finished temp file to disk and rename it over output_path in one step"""
+    # os.replace is atomic when both paths are on the same file system, so readers
+    # and crashes see either the old file or the complete new one, never a mix
+    if os.path.exists(output_path):
+        shutil.copymode(output_path, temp_path)  # Keep the permissions of the file being replaced
+    with open(temp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, output_path)
+    if os.name != 'nt':
+        # Make the rename itself durable; directories cannot be opened on Windows
+        try:
+            directory = os.open(os.path.dirname(os.path.abspath(output_path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        except OSError:
+            pass  # Not supported by every file system
+
+def preflight_pdf(path):
+    """Inspect one merge input without copying any pages; safe to run in a worker process"""
+    info = {
+        'path': path,
+        'name': os.path.basename(path),
+        'ok': False,
+        'error': None,
+        'size': 0,
+        'pages': 0,
+        'encrypted': False,
+        'repaired': False,  # Damaged file that MuPDF had to reconstruct
+        'page_sizes': {},  # "WIDTHxHEIGHT" in points -> page count
+    }
+    try:
+        info['size'] = os.path.getsize(path)
+        doc = fitz.open(path)
+        try:
+            if doc.is_encrypted:
+                info['encrypted'] = True
+                info['error'] = "document is encrypted"
+                return info
+            info['repaired'] = doc.is_repaired
+            info['pages'] = len(doc)
+            for page_num in range(len(doc)):
+                # Reads the page dictionary only; the page content is not loaded
+                rect = doc.page_cropbox(page_num)
+                key = f"{round(rect.width)}x{round(rect.height)}"
+                info['page_sizes'][key] = info['page_sizes'].get(key, 0) + 1
+        finally:
+            doc.close()
+        if info['pages'] == 0:
+            info['error'] = "document has no pages"
+        else:
+            info['ok'] = True
+    except Exception as e:
+        info['error'] = str(e)
+    return info
 
 class PDFEditor:
     """Backend class for PDF modifications with proper transparency handling and zoom support"""
     def __init__(self):
         self.modifications = []
         self.current_pdf = None
+        self.session = None
+        self.replaced_source = False  # Whether the last save wrote over current_pdf
         self.scale_factor = 2  # Default scale factor
+        self.signature_dpi = 300  # Signatures are downsampled to this resolution before embedding
+        self.merge_memory_limit = 512 * 1024 * 1024  # Larger merges are spooled to disk in chunks
+        self.last_merge_report = None
+        self.preflight_parallel_min = 8  # Fewer inputs are checked in-process
+        self.merge_dedup = True  # Share identical fonts and images between merged inputs
+        self.vector_signatures = True  # Insert recorded signature strokes as paths instead of images
         
-    def set_current_pdf(self, pdf_path, scale_factor=2):
-        """Set the current PDF being edited with scale factor"""
+    def set_current_pdf(self, pdf_path, scale_factor=2, session=None):
+        """Set the current PDF being edited (a path or in-memory bytes) with scale factor"""
+        # session is the viewer's DocumentSession of the same PDF, if there is one;
+        # saving then checks that the file has not changed since it was opened
         self.current_pdf = pdf_path
+        self.session = session
         self.scale_factor = scale_factor
         print(f"PDF Editor initialized with scale factor: {self.scale_factor}")
         
@@ -28,275 +113,658 @@ class PDFEditor:
             print("Warning: signature_pixmap is None")
             return
         try:
-            # Scale the pixmap to the widget's current size if needed
-            if signature_pixmap.size() != size:
-                signature_pixmap = signature_pixmap.scaled(
-                    size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation
-                )
+            # Convert widget pixels to PDF points, accounting for scale factor and zoom
+            scale_adjustment = 1.0 / (self.scale_factor * zoom_level)
+            x = position.x() * scale_adjustment
+            y = position.y() * scale_adjustment
+            rect = fitz.Rect(x, y,
+                             x + size.width() * scale_adjustment,
+                             y + size.height() * scale_adjustment)
 
-            # Convert QPixmap to QImage in ARGB32 format (widely supported)
-            image = signature_pixmap.toImage().convertToFormat(QImage.Format.Format_ARGB32)
-
-            # Convert QImage to numpy array, handling stride correctly
-            width = image.width()
-            height = image.height()
-            ptr = image.bits()
-            ptr.setsize(image.sizeInBytes())
-            arr = np.frombuffer(ptr, np.uint8).reshape((height, image.bytesPerLine() // 4, 4))
-            arr = arr[:, :width, :]
-
-            # Convert BGRA to RGBA for PIL
-            arr = arr[..., [2, 1, 0, 3]]
-
-            # Create PIL Image with RGBA (preserving transparency)
-            pil_image = Image.fromarray(arr, 'RGBA')
-
-            # Store modification with zoom level
-            self.modifications.append({
-                'type': 'signature',
-                'image': pil_image,
-                'page': page_num,
-                'position': position if isinstance(position, QPoint) else QPoint(position),
-                'size': size,
-                'pixmap': signature_pixmap,  # Keep original pixmap for reference
-                'zoom_level': zoom_level  # Store zoom level
-            })
-
-            print(f"Added signature modification: page {page_num}, pos ({position.x()}, {position.y()}), "
-                  f"size ({size.width()}, {size.height()}), zoom {zoom_level:.2f}")
+            self.add_signature_image(signature_pixmap, page_num, rect)
 
         except Exception as e:
             print(f"Error preparing signature: {str(e)}")
             traceback.print_exc()
+    
+    def add_signature_image(self, image, page_num, rect):
+        """Add a signature covering rect (PDF points) from encoded image bytes, a fitz.Pixmap or a QPixmap"""
+        rect = fitz.Rect(rect)
+        if isinstance(image, QPixmap):
+            # fitz.Pixmap samples with alpha are premultiplied RGBA, as in qimage_from_pixmap
+            image = image.toImage().convertToFormat(QImage.Format.Format_RGBA8888_Premultiplied)
+            samples = image.constBits().asstring(image.sizeInBytes())
+            pixmap = fitz.Pixmap(fitz.csRGB, image.width(), image.height(), samples, True)
+        else:
+            pixmap = image if isinstance(image, fitz.Pixmap) else fitz.Pixmap(image)
+        
+        # Downsample to the target resolution; more pixels than that only add size
+        target_width = max(1, round(rect.width / 72 * self.signature_dpi))
+        if pixmap.width > target_width:
+            target_height = max(1, round(pixmap.height * target_width / pixmap.width))
+            pixmap = fitz.Pixmap(pixmap, target_width, target_height, None)
+        
+        stream = pixmap.tobytes("png")
+        self.modifications.append({
+            'type': 'signature',
+            'stream': stream,  # PNG bytes, inserted without touching the disk
+            # Identical signatures share one embedded image stream on save
+            'image_hash': hashlib.sha1(stream).hexdigest(),
+            'page': page_num,
+            'rect': rect
+        })
         
+    def add_signature_strokes(self, signature, page_num, rect):
+        """Add a signature covering rect (PDF points) as vector paths from SignaturePad.get_strokes"""
+        self.modifications.append({
+            'type': 'signature_paths',
+            'signature': signature,
+            # Identical signatures share one drawing on save
+            'signature_hash': hashlib.sha1(json.dumps(signature, sort_keys=True).encode()).hexdigest(),
+            'page': page_num,
+            'rect': fitz.Rect(rect)
+        })
+        
+    def _signature_drawing(self, signature):
+        """One-page document with the signature strokes, in pad pixels as points"""
+        width, height = signature['size']
+        drawing = fitz.open()
+        page = drawing.new_page(width=width, height=height)
+        shape = page.new_shape()
+        for stroke in signature['strokes']:
+            points = [fitz.Point(x, y) for x, y, t in stroke]
+            if len(points) < 3:
+                shape.draw_polyline(points)
+                continue
+            # Smooth the simplified polyline: a curve through the midpoints of its
+            # segments, bending towards each recorded point, as pen input tools do
+            start = (points[0] + points[1]) / 2
+            shape.draw_line(points[0], start)
+            for control, following in zip(points[1:-1], points[2:]):
+                end = (control + following) / 2
+                # The quadratic segment as the equivalent cubic Bezier
+                shape.draw_bezier(start, start + (control - start) * (2 / 3),
+                                  end + (control - end) * (2 / 3), end)
+                start = end
+            shape.draw_line(start, points[-1])
+        shape.finish(color=[c / 255 for c in signature['color']], width=signature['pen_width'],
+                     lineCap=1, lineJoin=1, closePath=False)  # Round, as on the pad
+        shape.commit()
+        return drawing
+    
     def add_text(self, text, page_num, position, font_size=14, zoom_level=1.0):
         """Add text to the PDF with zoom adjustment"""
         if not text:
             print("Warning: empty text")
             return
-            
-        # Store modification with zoom level
+        
+        # Convert widget pixels to PDF points, accounting for scale factor and zoom
+        scale_adjustment = 1.0 / (self.scale_factor * zoom_level)
+        point = fitz.Point(position.x() * scale_adjustment, position.y() * scale_adjustment)
+        
+        # Adjust font size for zoom
+        self.add_text_at(text, page_num, point, font_size / zoom_level)
+    
+    def add_text_at(self, text, page_num, position, font_size=14):
+        """Add text whose top-left corner is at position (PDF points)"""
+        if not text:
+            print("Warning: empty text")
+            return
+        
+        # Store the baseline point, one font size below the top edge
+        position = fitz.Point(position)
         self.modifications.append({
             'type': 'text',
             'text': text,
             'page': page_num,
-            'position': position if isinstance(position, QPoint) else QPoint(position),
-            'font_size': font_size,
-            'zoom_level': zoom_level  # Store zoom level
+            'point': fitz.Point(position.x, position.y + font_size),
+            'font_size': font_size
         })
-        
-        print(f"Added text modification: page {page_num}, text '{text[:30]}...', "
-              f"pos ({position.x()}, {position.y()}), zoom {zoom_level:.2f}")
     
-    def merge_pdfs(self, pdf_paths):
-        """Merge multiple PDFs into one temporary PDF and return its path"""
-        if not pdf_paths:
-            return None
+    def preflight_pdfs(self, pdf_paths, jobs=None, progress=None, cancelled=None):
+        """Check merge inputs concurrently; returns one preflight_pdf() dict per path, in order"""
+        # Returns None if cancelled. Small batches, or a single CPU, are not worth
+        # starting processes for.
+        jobs = jobs or os.cpu_count() or 1
+        if jobs < 2 or len(pdf_paths) < self.preflight_parallel_min:
+            results = []
+            for path in pdf_paths:
+                if cancelled is not None and cancelled():
+                    return None
+                results.append(preflight_pdf(path))
+            return results
 
-        temp_path = None
+        import concurrent.futures
+        import multiprocessing
+        results = [None] * len(pdf_paths)
+        # Spawned rather than forked: the GUI process has running threads
+        context = multiprocessing.get_context('spawn')
         try:
-            merged_doc = fitz.open()  # New empty PDF
-            total_pages = 0
-            skipped_files = []
-            successful_files = []
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+                futures = {pool.submit(preflight_pdf, path): index for index, path in enumerate(pdf_paths)}
+                for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                    results[futures[future]] = future.result()
+                    if cancelled is not None and cancelled():
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        return None
+                    if progress is not None:
+                        progress(0, len(pdf_paths), f"Checked {done} of {len(pdf_paths)} files")
+        except (concurrent.futures.process.BrokenProcessPool, OSError) as e:
+            # e.g. worker processes cannot be started; check the rest in-process
+            print(f"Parallel preflight failed ({str(e)}), checking files one by one")
+            for index, path in enumerate(pdf_paths):
+                if results[index] is None:
+                    if cancelled is not None and cancelled():
+                        return None
+                    results[index] = preflight_pdf(path)
+        return results
+    
+    def merge_pdfs(self, pdf_paths, progress=None, cancelled=None):
+        """Merge multiple PDFs; returns bytes, or the path of a spooled temp file for large merges"""
+        # Inputs that fit within merge_memory_limit are merged in memory and nothing
+        # touches the disk until the user saves. Larger merges are written to a temp
+        # file in chunks of about half the limit, each appended as an incremental
+        # update and then released, so memory stays bounded however many files there are.
+        # All inputs are preflighted first, so unusable files are skipped and the
+        # page count and memory mode are known before any pages are copied.
+        # progress(files_done, usable_file_count, message) is called after each file and
+        # cancelled() is checked before each one. Details end up in last_merge_report.
+        report = {
+            'merged': [],  # (file name, page count)
+            'skipped': [],  # (file name, reason)
+            'repaired': [],  # Names of damaged files that were merged after repair
+            'page_sizes': {},  # "WIDTHxHEIGHT" in points -> page count, over usable inputs
+            'planned_pages': 0,
+            'total_pages': 0,
+            'cancelled': False,
+            'spooled': False,
+            'dedup_objects': 0,  # Duplicate fonts, images and other streams replaced by a shared copy
+            'dedup_bytes': 0,  # Stream bytes those duplicates would have taken
+        }
+        self.last_merge_report = report
+        if not pdf_paths:
+            return None
 
-            for path in pdf_paths:
-                try:
-                    doc = fitz.open(path)
-                    # Check if document is encrypted
-                    if doc.is_encrypted:
-                        print(f"Skipping encrypted PDF {path}")
-                        skipped_files.append(os.path.basename(path))
-                        doc.close()
+        spool_path = None
+        merged_doc = None
+        result = None
+        with tracing.span('merge', files=len(pdf_paths)) as trace:
+            try:
+                with tracing.span('preflight', files=len(pdf_paths)):
+                    preflight = self.preflight_pdfs(pdf_paths, progress=progress, cancelled=cancelled)
+                if preflight is None:
+                    print("Merge cancelled")
+                    report['cancelled'] = True
+                    return None
+            
+                for info in preflight:
+                    if not info['ok']:
+                        print(f"Skipping PDF {info['path']}: {info['error']}")
+                        report['skipped'].append((info['name'], info['error']))
                         continue
+                    report['planned_pages'] += info['pages']
+                    for key, count in info['page_sizes'].items():
+                        report['page_sizes'][key] = report['page_sizes'].get(key, 0) + count
+                    if info['repaired']:
+                        print(f"Warning: {info['name']} is damaged and was repaired")
+                        report['repaired'].append(info['name'])
+            
+                if report['planned_pages'] == 0:
+                    print("No valid pages to merge")
+                    return None
+            
+                if sum(info['size'] for info in preflight if info['ok']) > self.merge_memory_limit:
+                    fd, spool_path = tempfile.mkstemp(suffix='.pdf', prefix='meshpdf_merged_')
+                    os.close(fd)
+                    report['spooled'] = True
+                    print(f"Merging {len(pdf_paths)} files in chunks via {spool_path}")
+            
+                merged_doc = fitz.open()  # New empty PDF
+                dedup_state = {}  # Content digests, kept across spooled chunks
+                spool_written = False
+                chunk_bytes = 0
+                chunk_pages = 0
 
-                    merged_doc.insert_pdf(doc)
-                    page_count = len(doc)
-                    total_pages += page_count
-                    successful_files.append(os.path.basename(path))
-                    print(f"Added {page_count} pages from {os.path.basename(path)}")
-                    doc.close()
+                usable = [info for info in preflight if info['ok']]
+                for index, info in enumerate(usable):
+                    if cancelled is not None and cancelled():
+                        print("Merge cancelled")
+                        report['cancelled'] = True
+                        break
 
-                except Exception as e:
-                    print(f"Skipping invalid PDF {path}: {str(e)}")
-                    skipped_files.append(os.path.basename(path))
-                    # Continue with others
+                    path = info['path']
+                    name = info['name']
+                    try:
+                        with tracing.span('merge file', file=name) as file_trace:
+                            doc = fitz.open(path)
+                            try:
+                                # Check if document is encrypted
+                                if doc.is_encrypted:
+                                    raise ValueError("document is encrypted")
+                                merged_doc.insert_pdf(doc)
+                                page_count = len(doc)
+                            finally:
+                                doc.close()
+                            file_trace.set(pages=page_count)
 
-            if total_pages == 0:
-                print("No valid pages to merge")
-                return None
+                        report['merged'].append((name, page_count))
+                        report['total_pages'] += page_count
+                        chunk_pages += page_count
+                        chunk_bytes += info['size']
 
-            # Save to temp file (Windows-safe)
-            fd, temp_path = tempfile.mkstemp(suffix='.pdf', prefix='meshpdf_merged_')
-            try:
-                os.close(fd)  # Close the file descriptor so PyMuPDF can write to it
-            except:
-                pass
-            
-            merged_doc.save(temp_path)
-            merged_doc.close()
+                    except Exception as e:
+                        print(f"Skipping PDF {path}: {str(e)}")
+                        report['skipped'].append((name, str(e)))
+                        # Continue with others
 
-            print(f"Merged PDF created at: {temp_path}")
-            print(f"Successfully merged: {', '.join(successful_files)}")
-            print(f"Total pages: {total_pages}")
-            
-            if skipped_files:
-                print(f"Skipped files: {', '.join(skipped_files)}")
+                    if spool_path and chunk_pages and chunk_bytes >= self.merge_memory_limit // 2:
+                        merged_doc = self._flush_merge_chunk(merged_doc, spool_path, spool_written,
+                                                             dedup_state, report)
+                        spool_written = True
+                        chunk_bytes = 0
+                        chunk_pages = 0
 
-            return temp_path
+                    if progress is not None:
+                        progress(index + 1, len(usable),
+                                 f"{report['total_pages']} of {report['planned_pages']} pages")
 
-        except Exception as e:
-            print(f"Merge error: {str(e)}")
-            traceback.print_exc()
-            # Clean up temp file if created but merge failed
-            if temp_path and os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
-            return None
-    
-    def save_pdf(self, output_path):
-        """Save the PDF with all modifications and proper transparency, accounting for zoom"""
-        if not self.current_pdf:
-            print("Error: No current PDF set")
-            return False
-            
-        if not self.modifications:
-            # If no modifications, just copy the original
-            print("No modifications to apply, copying original PDF")
-            try:
-                shutil.copy2(self.current_pdf, output_path)
-                return True
-            except Exception as e:
-                print(f"Error copying PDF: {str(e)}")
-                return False
+                if report['cancelled']:
+                    return None
+
+                if report['total_pages'] == 0:
+                    print("No valid pages to merge")
+                    return None
+
+                if spool_path:
+                    if chunk_pages:
+                        merged_doc = self._flush_merge_chunk(merged_doc, spool_path, spool_written,
+                                                             dedup_state, report)
+                    result = spool_path
+                    print(f"Merged PDF spooled to {spool_path} ({os.path.getsize(spool_path) / (1024 * 1024):.1f} MB)")
+                else:
+                    if self.merge_dedup:
+                        with tracing.span('dedup'):
+                            self._record_dedup(report, self._dedup_resources(merged_doc, dedup_state))
+                    result = merged_doc.tobytes()
+                    print(f"Merged PDF created in memory ({len(result) / (1024 * 1024):.1f} MB)")
             
-        temp_files = []
-        try:
-            print(f"Saving PDF with {len(self.modifications)} modifications")
+                if report['dedup_objects']:
+                    print(f"Shared {report['dedup_objects']} duplicate resources, "
+                          f"saving {report['dedup_bytes'] / (1024 * 1024):.1f} MB")
+                print(f"Successfully merged: {', '.join(name for name, _ in report['merged'])}")
+                print(f"Total pages: {report['total_pages']}")
             
-            # Open the PDF with PyMuPDF
-            doc = fitz.open(self.current_pdf)
+                if report['skipped']:
+                    print(f"Skipped files: {', '.join(name for name, _ in report['skipped'])}")
+
+                return result
+
+            except Exception as e:
+                print(f"Merge error: {str(e)}")
+                traceback.print_exc()
+                return None
+        
+            finally:
+                trace.set(pages=report['total_pages'], skipped=len(report['skipped']),
+                          spooled=report['spooled'], cancelled=report['cancelled'],
+                          dedup_objects=report['dedup_objects'])
+                if merged_doc is not None:
+                    merged_doc.close()
+                # Remove the spool file unless it is the result
+                if spool_path and result is None and os.path.exists(spool_path):
+                    try:
+                        os.remove(spool_path)
+                    except OSError:
+                        pass
+    
+    def _flush_merge_chunk(self, merged_doc, spool_path, appended, dedup_state, report):
+        """Write pages merged so far to the spool file and return a reopened, unloaded document"""
+        # Only objects added since the last flush are deduplicated; they are
+        # matched against everything already written
+        if self.merge_dedup:
+            first_xref = dedup_state.get('next_xref', 1)
+            with tracing.span('dedup', first_xref=first_xref):
+                self._record_dedup(report, self._dedup_resources(merged_doc, dedup_state, first_xref))
+        if appended:
+            # Only the new pages and the updated page tree are appended
+            merged_doc.save(spool_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        else:
+            merged_doc.save(spool_path)
+        merged_doc.close()
+        # Reopening drops the objects held in memory; they are loaded again only on demand
+        merged_doc = fitz.open(spool_path)
+        dedup_state['next_xref'] = merged_doc.xref_length()
+        return merged_doc
+    
+    @staticmethod
+    def _record_dedup(report, counts):
+        """Add (objects, bytes) from a dedup pass to a merge report"""
+        report['dedup_objects'] += counts[0]
+        report['dedup_bytes'] += counts[1]
+    
+    def _object_digest(self, doc, xref, dedup_state, sources, visiting):
+        """Content digest of an object, folding in the digests of objects it references"""
+        digests = dedup_state['digests']
+        digest = digests.get(xref)
+        if digest is not None:
+            return digest
+        if xref in visiting:
+            return f"cycle-{xref}".encode()  # Reference cycle; fall back to the object number
+        visiting.add(xref)
+        
+        def reference_digest(match):
+            return "<" + self._object_digest(doc, int(match.group(1)), dedup_state, sources, visiting).hex() + ">"
+        
+        source = sources.get(xref)
+        if source is None:
+            source = doc.xref_object(xref, compressed=True)
+        hasher = hashlib.sha1(_OBJECT_REF.sub(reference_digest, source).encode())
+        # Only stream dictionaries carry /Length; skips a lookup for most objects
+        if '/Length' in source and doc.xref_is_stream(xref):
+            raw = doc.xref_stream_raw(xref)
+            hasher.update(b"stream")
+            hasher.update(raw)
+            dedup_state['stream_sizes'][xref] = len(raw)
+        digest = hasher.digest()
+        digests[xref] = digest
+        visiting.discard(xref)
+        return digest
+    
+    def _dedup_resources(self, doc, dedup_state, first_xref=1):
+        """Point references to identical streams and fonts at one shared copy; returns (objects, bytes)"""
+        # Streams other than page contents (images, form XObjects, font files, ...) and
+        # font dictionaries are compared by a digest that includes the objects they
+        # reference, so two images are only shared if their color spaces and soft
+        # masks match as well.
+        # PyMuPDF calls dominate the cost, so each object's source is fetched once.
+        dedup_state.setdefault('digests', {})
+        dedup_state.setdefault('stream_sizes', {})
+        canonical = dedup_state.setdefault('canonical', {})
+        xref_count = doc.xref_length()
+        sources = {xref: doc.xref_object(xref, compressed=True) for xref in range(first_xref, xref_count)}
+        # Page content streams stay per page, since later edits may rewrite them
+        page_contents = set()
+        for source in sources.values():
+            for match in _PAGE_CONTENTS.finditer(source):
+                page_contents.update(int(ref) for ref in _OBJECT_REF.findall(match.group(1)))
+        remap = {}  # Duplicate xref -> shared xref
+        for xref, source in sources.items():
+            if xref in page_contents or ('/Length' not in source and not _DEDUP_TYPE_KEY.search(source)):
+                continue
+            digest = self._object_digest(doc, xref, dedup_state, sources, set())
+            if xref not in dedup_state['stream_sizes'] and not _DEDUP_TYPE_KEY.search(source):
+                continue  # Has a /Length key but is not a stream
+            shared = canonical.setdefault(digest, xref)
+            if shared != xref:
+                remap[xref] = shared
+        if not remap:
+            return 0, 0
+        
+        def shared_reference(match):
+            return f"{remap.get(int(match.group(1)), int(match.group(1)))} 0 R"
+        
+        # Objects written by earlier chunks never refer to the new duplicates
+        for xref, source in sources.items():
+            if xref in remap or ' 0 R' not in source:
+                continue
+            updated = _OBJECT_REF.sub(shared_reference, source)
+            if updated != source:
+                doc.update_object(xref, updated)
+        # Replacing a duplicate with null also drops its stream, so it is not written out
+        for xref in remap:
+            doc.update_object(xref, "null")
+        saved_bytes = sum(dedup_state['stream_sizes'].get(xref, 0) for xref in remap)
+        return len(remap), saved_bytes
+    
+    def _write_original(self, output_path):
+        """Write the unmodified current PDF to output_path"""
+        if isinstance(self.current_pdf, (bytes, bytearray)):
+            with open(output_path, 'wb') as f:
+                f.write(self.current_pdf)
+        else:
+            shutil.copyfile(self.current_pdf, output_path)
+    
+    def _open_for_save(self, temp_path, optimize):
+        """Open the document modifications are applied to; returns (doc, incremental)"""
+        if not optimize:
+            # An incremental update appends to a copy of the original bytes
+            self._write_original(temp_path)
+            doc = fitz.open(temp_path)
+            if doc.can_save_incrementally():
+                return doc, True
             
-            # Process each modification
-            for i, mod in enumerate(self.modifications):
-                try:
-                    page = doc[mod['page']]
-                    page_rect = page.rect
-                    
-                    # Account for scale factor and zoom level in position calculations
-                    zoom_level = mod.get('zoom_level', 1.0)
-                    scale_adjustment = 1.0 / (self.scale_factor * zoom_level)
-                    
-                    if mod['type'] == 'signature':
-                        # Save signature to temporary PNG file with transparency
-                        temp_path = f'temp_signature_{i}_{os.getpid()}.png'
-                        temp_files.append(temp_path)
+            # e.g. repaired or encrypted files; fall back to a plain full rewrite
+            print("Incremental save not possible for this PDF, rewriting it instead")
+            doc.close()
+        return self._open_copy(), False
+    
+    def _open_copy(self):
+        """A private document of the current PDF to apply modifications to"""
+        if self.session is not None:
+            return self.session.copy()
+        return open_pdf(self.current_pdf)
+    
+    def _apply_modifications(self, doc, progress=None, cancelled=None):
+        """Insert all pending signatures and text into an open document, page by page"""
+        # progress(pages_done, page_count, message) is called after each page with
+        # modifications and cancelled() is checked before each one. Returns False if
+        # cancelled, leaving the document partly modified.
+        image_xrefs = {}  # Signature content hash -> xref of its embedded image
+        drawings = {}  # Signature strokes hash -> document with the drawn strokes
+        was_cancelled = False
+        
+        # Group by page, keeping the order they were added in as the stacking order
+        pages = {}
+        for i, mod in enumerate(self.modifications):
+            pages.setdefault(mod['page'], []).append((i, mod))
+        
+        with tracing.span('apply modifications', count=len(self.modifications), pages=len(pages)) as trace:
+            for done, page_num in enumerate(sorted(pages)):
+                if cancelled is not None and cancelled():
+                    was_cancelled = True
+                    trace.set(cancelled=True)
+                    break
+                page = doc[page_num]
+                # Consecutive text on a page is collected in one Shape and committed
+                # as a single content fragment, instead of one per text. Helvetica
+                # stays a non-embedded standard font, registered once per document.
+                text_shape = None
+                for i, mod in pages[page_num]:
+                    try:
+                        if mod['type'] == 'text':
+                            if text_shape is None:
+                                text_shape = page.new_shape()
+                            # Baseline point and font size are already in PDF coordinates
+                            text_shape.insert_text(
+                                mod['point'],
+                                mod['text'],
+                                fontsize=mod['font_size'],
+                                fontname="helv",  # Helvetica font
+                                color=(0, 0, 0),  # Black color
+                                render_mode=0  # Fill mode
+                            )
+                            continue
                         
-                        # Save with transparency preserved
-                        mod['image'].save(temp_path, format='PNG', compress_level=0)
+                        if text_shape is not None:
+                            # Commit the text first, so it stays below overlays added after it
+                            text_shape.commit()
+                            text_shape = None
                         
-                        # Calculate position and size in PDF coordinates
-                        x = mod['position'].x() * scale_adjustment
-                        y = mod['position'].y() * scale_adjustment
-                        width = mod['size'].width() * scale_adjustment
-                        height = mod['size'].height() * scale_adjustment
+                        if mod['type'] == 'signature':
+                            # Position and size are already in PDF coordinates
+                            rect = mod['rect']
                         
-                        # Create rectangle for image insertion
-                        rect = fitz.Rect(
-                            x,
-                            y,
-                            x + width,
-                            y + height
-                        )
+                            # Reference an identical signature that is already embedded
+                            image_xref = image_xrefs.get(mod['image_hash'])
+                            if image_xref:
+                                page.insert_image(rect, xref=image_xref, keep_proportion=True, overlay=True)
+                                continue
                         
-                        # Verify the temp file exists and has content
-                        if not os.path.exists(temp_path):
-                            print(f"Warning: Temp file {temp_path} not found")
-                            continue
-                            
-                        file_size = os.path.getsize(temp_path)
-                        print(f"Temp signature file size: {file_size} bytes")
-                        
-                        # Insert image into PDF with transparency overlay
-                        try:
-                            # Use overlay=True to preserve transparency
-                            page.insert_image(
+                            # Insert the in-memory PNG; overlay=True keeps the transparency
+                            image_xref = page.insert_image(
                                 rect,
-                                filename=temp_path,
+                                stream=mod['stream'],
                                 keep_proportion=True,
-                                overlay=True,  # Important for transparency
+                                overlay=True,
                                 rotate=0
                             )
-                            print(f"Successfully inserted signature at rect: {rect}")
-                        except Exception as img_error:
-                            print(f"Error inserting image: {str(img_error)}")
-                            # Try alternative method
-                            img_doc = fitz.open(temp_path)
-                            pix = img_doc[0].get_pixmap(alpha=True)
-                            page.insert_image(rect, pixmap=pix, overlay=True)
-                            img_doc.close()
-                        
-                    elif mod['type'] == 'text':
-                        # Calculate position in PDF coordinates
-                        x = mod['position'].x() * scale_adjustment
-                        y = mod['position'].y() * scale_adjustment
-                        
-                        # Adjust font size for zoom
-                        actual_font_size = mod['font_size'] / zoom_level
-                        
-                        # Adjust y coordinate for text baseline
-                        y += actual_font_size  # Text baseline adjustment
+                            image_xrefs[mod['image_hash']] = image_xref
                         
-                        # Insert text into PDF
-                        point = fitz.Point(x, y)
+                        elif mod['type'] == 'signature_paths':
+                            # Every placement of the same drawing references one copied form XObject
+                            drawing = drawings.get(mod['signature_hash'])
+                            if drawing is None:
+                                drawing = self._signature_drawing(mod['signature'])
+                                drawings[mod['signature_hash']] = drawing
+                            page.show_pdf_page(mod['rect'], drawing, 0, keep_proportion=True, overlay=True)
                         
-                        # Create text insertion with proper font
-                        text_dict = {
-                            "text": mod['text'],
-                            "fontsize": actual_font_size,
-                            "color": (0, 0, 0),  # Black color
-                            "fontname": "helv",  # Helvetica font
-                            "render_mode": 0  # Fill mode
-                        }
-                        
-                        page.insert_text(
-                            point=point,
-                            **text_dict
-                        )
-                        
-                        print(f"Inserted text at ({x:.1f}, {y:.1f}) with size {actual_font_size:.1f}")
-                        
-                except Exception as e:
-                    print(f"Error processing modification {i}: {str(e)}")
-                    traceback.print_exc()
-                    # Continue with other modifications even if one fails
-                    
-            # Save the modified PDF with compression
-            doc.save(output_path, garbage=4, deflate=True, clean=True)
-            doc.close()
-            
-            print(f"PDF saved successfully to: {output_path}")
-            return True
-            
-        except Exception as e:
-            print(f"Error saving PDF: {str(e)}")
-            traceback.print_exc()
+                    except Exception as e:
+                        print(f"Error processing modification {i}: {str(e)}")
+                        traceback.print_exc()
+                        # Continue with other modifications even if one fails
+                
+                if text_shape is not None:
+                    try:
+                        text_shape.commit()
+                    except Exception as e:
+                        print(f"Error writing text on page {page_num}: {str(e)}")
+                        traceback.print_exc()
+                if progress is not None:
+                    progress(done + 1, len(pages), f"Applied changes to page {page_num + 1}")
+            trace.set(images=len(image_xrefs), drawings=len(drawings))
+        for drawing in drawings.values():
+            drawing.close()
+        return not was_cancelled
+    
+    def _saved_over_source(self, output_path):
+        """After writing output_path, note whether it replaced the PDF being edited"""
+        # The saved file contains the modifications, so the session (and the viewer's
+        # overlays) no longer match it; the session's changed_on_disk() now refuses
+        # further saves until the caller reopens the file
+        self.replaced_source = (isinstance(self.current_pdf, str) and os.path.exists(self.current_pdf)
+                                and os.path.samefile(output_path, self.current_pdf))
+    
+    def save_pdf(self, output_path, optimize=False, progress=None, cancelled=None):
+        """Save the PDF with all modifications; returns True, False on failure, or None if cancelled"""
+        # By default only the changed objects are appended to a copy of the original
+        # (an incremental update). optimize=True rewrites and recompresses everything.
+        # Either way the new file is written next to output_path, flushed to disk and
+        # renamed over it, so output_path keeps its old content if saving fails, is
+        # cancelled or is interrupted by a crash. Safe to run on a worker thread:
+        # progress(done, total, message) is called after each page with modifications
+        # and before the file is written, and cancelled() is checked at the same points.
+        self.replaced_source = False
+        if self.current_pdf is None:
+            print("Error: No current PDF set")
+            return False
+        if self.session is not None and self.session.changed_on_disk():
+            # Overlays were placed on the pages as they were when the file was opened
+            print(f"Error: {self.current_pdf} changed on disk since it was opened; reopen it before saving")
             return False
+        
+        temp_path = output_path + '.meshpdf-tmp'
+        try:
+            if not self.modifications:
+                # If no modifications, just copy the original
+                print("No modifications to apply, copying original PDF")
+                try:
+                    if isinstance(self.current_pdf, (bytes, bytearray)):
+                        self._write_original(temp_path)
+                    else:
+                        shutil.copy2(self.current_pdf, temp_path)
+                    replace_file(temp_path, output_path)
+                    self._saved_over_source(output_path)
+                    return True
+                except Exception as e:
+                    print(f"Error copying PDF: {str(e)}")
+                    return False
             
-        finally:
-            # Clean up all temp files
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
+            with tracing.span('save', modifications=len(self.modifications)) as trace:
+                try:
+                    print(f"Saving PDF with {len(self.modifications)} modifications")
+                    start = time.perf_counter()
+                    
+                    # The last progress step is writing the file
+                    page_progress = None
+                    if progress is not None:
+                        page_progress = lambda done, total, message: progress(done, total + 1, message)
+                    
+                    doc, incremental = self._open_for_save(temp_path, optimize)
                     try:
-                        os.remove(temp_file)
-                        print(f"Removed temp file: {temp_file}")
-                    except Exception as e:
-                        print(f"Warning: Could not remove temp file {temp_file}: {str(e)}")
+                        if not self._apply_modifications(doc, page_progress, cancelled):
+                            print("Save cancelled")
+                            trace.set(cancelled=True)
+                            return None
+                        if progress is not None:
+                            pages = len({mod['page'] for mod in self.modifications})
+                            progress(pages, pages + 1, "Writing file...")
+                        
+                        if incremental:
+                            # Append only the changed objects, compressing the new streams
+                            doc.save(temp_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, deflate=True)
+                            mode = "incremental"
+                        else:
+                            # Full rewrite, with compression and garbage collection when optimizing
+                            options = dict(garbage=4, deflate=True, clean=True) if optimize else {}
+                            doc.save(temp_path, **options)
+                            mode = "optimized rewrite" if optimize else "full rewrite"
+                    finally:
+                        doc.close()
                     
-            # Clear modifications after saving
+                    if cancelled is not None and cancelled():
+                        print("Save cancelled")
+                        trace.set(cancelled=True)
+                        return None
+                    replace_file(temp_path, output_path)
+                    self._saved_over_source(output_path)
+                    
+                    trace.set(mode=mode)
+                    print(f"PDF saved successfully to: {output_path} ({mode}, {time.perf_counter() - start:.2f}s)")
+                    return True
+                
+                except Exception as e:
+                    print(f"Error saving PDF: {str(e)}")
+                    traceback.print_exc()
+                    return False
+        
+        finally:
+            # Clear modifications after saving, and remove the temp file unless it was renamed
             self.modifications.clear()
+            if os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def render_for_print(self, dpi, page_ready, progress=None, cancelled=None):
+        """Rasterize every page with modifications applied, one page at a time"""
+        # Works on a private in-memory copy, so it can run on a worker thread and
+        # leaves the pending modifications in place. page_ready(page_num, image) gets
+        # each page as a QImage at the given resolution; only that page is held here.
+        # Returns the number of pages rendered, or None if cancelled.
+        from page_renderer import qimage_from_pixmap
+        with tracing.span('print render', dpi=dpi) as trace:
+            doc = self._open_copy()
+            try:
+                self._apply_modifications(doc)
+                page_count = len(doc)
+                for page_num in range(page_count):
+                    if cancelled is not None and cancelled():
+                        print("Print rendering cancelled")
+                        return None
+                    with tracing.span('print render page', page=page_num):
+                        pix = doc[page_num].get_pixmap(dpi=dpi, alpha=False)
+                        image = qimage_from_pixmap(pix)
+                        image.setDotsPerMeterX(round(dpi / 0.0254))
+                        image.setDotsPerMeterY(round(dpi / 0.0254))
+                        del pix
+                    page_ready(page_num, image)
+                    if progress is not None:
+                        progress(page_num + 1, page_count, f"Rendered page {page_num + 1} of {page_count}")
+                trace.set(pages=page_count)
+                return page_count
+            finally:
+                doc.close()
 
 # Export class
-__all__ = ['PDFEditor']
\ No newline at end of file
+__all__ = ['PDFEditor', 'open_pdf', 'preflight_pdf', 'replace_file']
\ No newline at end of file
@@ -1,10 +1,20 @@
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QLabel, QScrollArea,  
-                            QMessageBox, QInputDialog, QMenu)
+                            QMessageBox, QInputDialog, QMenu, QProgressDialog)
 from PyQt6.QtGui import QAction
-from PyQt6.QtCore import Qt, QPoint, pyqtSignal
-from PyQt6.QtGui import QPixmap, QPainter, QImage, QCursor, QFont, QMouseEvent, QColor
-import fitz  # PyMuPDF
+from PyQt6.QtCore import Qt, QPoint, QRect, QSizeF, QTimer, pyqtSignal
+from PyQt6.QtGui import QPixmap, QPainter, QImage, QCursor, QMouseEvent
+import bisect
+import functools
+import threading
 import traceback
+from lazy_import import fitz  # PyMuPDF, imported once a document is opened
+from page_renderer import PageRenderer
+from render_cache import RenderCache
+from pdf_editor import PDFEditor
+from document_session import DocumentSession
+from background_tasks import BackgroundTask
+from overlay_model import Overlay, OverlayModel
+import tracing
 
 class DraggableLabel(QLabel):
     """A QLabel that can be dragged, edited, and deleted"""
@@ -13,12 +23,16 @@ class DraggableLabel(QLabel):
         self.draggable = True
         self.dragging = False
         self.offset = QPoint()
+        self.press_pos = QPoint()
+        self.viewer = None  # PDFViewer whose overlay model this label is a view of
+        self.overlay = None  # The overlay this label shows
         self.setMouseTracking(True)
         
     def mousePressEvent(self, event: QMouseEvent):
         if event.button() == Qt.MouseButton.LeftButton and self.draggable:
             self.dragging = True
             self.offset = event.pos()
+            self.press_pos = self.pos()
             self.setCursor(QCursor(Qt.CursorShape.ClosedHandCursor))
             self.raise_()  # Bring to front when clicked
             event.accept()
@@ -39,13 +53,14 @@ class DraggableLabel(QLabel):
         if event.button() == Qt.MouseButton.LeftButton and self.draggable:
             self.dragging = False
             self.setCursor(QCursor(Qt.CursorShape.OpenHandCursor))
+            if self.viewer is not None and self.pos() != self.press_pos:
+                self.viewer.sync_overlay(self)  # Store the new position
             event.accept()
     
     def mouseDoubleClickEvent(self, event: QMouseEvent):
         """Handle double-click for editing"""
-        if hasattr(self, 'modification_info'):
-            mod_info = self.modification_info
-            if mod_info['type'] == 'text':
+        if self.overlay is not None:
+            if self.overlay.type == 'text':
                 # Edit text
                 text, ok = QInputDialog.getText(
                     self, "Edit Text", "Edit your text:", 
@@ -54,8 +69,10 @@ class DraggableLabel(QLabel):
                 if ok and text:
                     self.setText(text)
                     self.adjustSize()
+                    if self.viewer is not None:
+                        self.viewer.sync_overlay(self)
                     print(f"Text edited: {text[:30]}...")
-            elif mod_info['type'] == 'signature':
+            elif self.overlay.type == 'signature':
                 # Re-open signature pad for editing
                 reply = QMessageBox.question(
                     self, "Edit Signature",
@@ -67,21 +84,17 @@ class DraggableLabel(QLabel):
                     sig_pad = SignaturePad(self.window())
                     if sig_pad.exec():
                         new_sig = sig_pad.get_signature()
-                        # Store the original pixmap
-                        self.original_pixmap = new_sig
-                        # Scale to current size
-                        scaled_sig = new_sig.scaled(
-                            self.size(), 
-                            Qt.AspectRatioMode.KeepAspectRatio, 
-                            Qt.TransformationMode.SmoothTransformation
-                        )
-                        self.setPixmap(scaled_sig)
+                        # Fit the new signature into the current box; the label scales it when painting
+                        self.resize(new_sig.size().scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatio))
+                        self.setPixmap(new_sig)
+                        if self.viewer is not None:
+                            self.viewer.sync_overlay(self, strokes=sig_pad.get_strokes())
                         print("Signature updated")
         event.accept()
     
     def contextMenuEvent(self, event):
         """Right-click context menu for delete and other options"""
-        if hasattr(self, 'modification_info'):
+        if self.overlay is not None:
             context_menu = QMenu(self)
             
             # Delete action
@@ -99,8 +112,11 @@ class DraggableLabel(QLabel):
     
     def delete_overlay(self):
         """Delete this overlay"""
-        print(f"Deleting {self.modification_info['type']} overlay")
-        self.deleteLater()
+        print(f"Deleting {self.overlay.type} overlay")
+        if self.viewer is not None:
+            self.viewer.remove_overlay(self)
+        else:
+            self.deleteLater()
             
     def enterEvent(self, event):
         if self.draggable:
@@ -116,15 +132,29 @@ class ClickableLabel(QLabel):
         super().__init__()
         self.viewer = viewer
         self.page_num = page_num
+        self.tiles = {}  # (column, row) -> (target QRect, QPixmap) for high zoom levels
         self.setMouseTracking(True)
         
     def mousePressEvent(self, event):
         # Pass the event to the viewer's click handler
         self.viewer.handle_click(event, self.page_num)
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.tiles:
+            # Draw sharp tiles over the stretched lower-resolution page
+            painter = QPainter(self)
+            for target, tile_pixmap in self.tiles.values():
+                if not tile_pixmap.isNull() and target.intersects(event.rect()):
+                    painter.drawPixmap(target, tile_pixmap)
+            painter.end()
 
 class PDFViewer(QScrollArea):
     zoom_changed = pyqtSignal(float)  # Signal for zoom level changes
     
+    # Internal: pages rendered by the print worker, delivered on the GUI thread
+    _print_page_ready = pyqtSignal(int, QImage)
+    
     def __init__(self):
         super().__init__()
         self.setWidgetResizable(True)
@@ -134,236 +164,446 @@ class PDFViewer(QScrollArea):
         self.layout.setAlignment(Qt.AlignmentFlag.AlignHCenter)
         
         # Initialize properties
-        self.current_doc = None
+        self.session = None  # DocumentSession of the open document
+        self.current_doc = None  # The session's document, used on the GUI thread
         self.current_file = None
         self.pages = []
         self.page_labels = []
         self.text_mode = False
         self.signature_mode = False
         self.current_signature = None
+        self.current_signature_strokes = None
         self.scale_factor = 2  # PDF rendering scale (200% for better quality)
         self.zoom_level = 1.0  # Current zoom level
-        self.overlays = []  # Store overlay information for persistence across zoom
+        
+        # Signatures and text live in the overlay model; the labels on the pages are views of it
+        self.overlay_model = OverlayModel()
+        self.overlay_views = {}  # Overlay id -> DraggableLabel showing it
+        
+        # Virtualized rendering: only pages near the viewport hold a pixmap
+        self.lazy_rendering = True
+        self.render_window = 2  # Pages kept rendered above/below the visible ones
+        self.rendered_pages = set()  # Pages requested from the renderer
+        self.final_pages = set()  # Pages showing their full-resolution image
+        self.page_tops = []  # Layout y-offset of every page, for viewport lookups
+        self.page_rects = []  # Page rectangles in PDF points, for zoom-time layout
+        
+        # Above max_page_pixels, whole pages are rendered as a backdrop at no more
+        # than the 100% zoom scale and the visible area is refined with
+        # tile_size x tile_size clip renders
+        self.max_page_pixels = 12_000_000
+        self.tile_size = 1024
         
         # Set scrollbar policies for better navigation
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOn)
+        
+        # Re-evaluate the visible pages whenever the viewport moves
+        self.verticalScrollBar().valueChanged.connect(self.update_visible_pages)
+        self.horizontalScrollBar().valueChanged.connect(self.update_visible_tiles)
+        
+        # Pages are rasterized off the GUI thread and delivered via signal
+        self.renderer = PageRenderer()
+        self.renderer.page_rendered.connect(self.on_page_rendered)
+        self.renderer.tile_rendered.connect(self.on_tile_rendered)
+        
+        # Full-resolution pixmaps of recently viewed pages
+        self.render_cache = RenderCache()
+        self.doc_key = None
+        
+        # Printing renders pages at printer resolution (capped at print_dpi) on a
+        # worker thread; at most print_queue_pages wait to be sent to the printer
+        self.print_dpi = 300
+        self.print_queue_pages = 2
+        self.print_job = None
+        self._print_page_ready.connect(self.on_print_page)
     
-    def collect_overlays(self):
-        """Collect all overlay information before clearing pages"""
-        overlays = []
-        for page_num, page_label in enumerate(self.page_labels):
-            for child in page_label.children():
-                if isinstance(child, DraggableLabel) and hasattr(child, 'modification_info'):
-                    mod_info = child.modification_info
-                    overlay_data = {
-                        'type': mod_info['type'],
-                        'page': page_num,
-                        'position': child.pos(),
-                        'size': child.size(),
-                        'original_zoom': mod_info.get('original_zoom', self.zoom_level)  # Use stored original zoom
-                    }
-                    
-                    if mod_info['type'] == 'signature':
-                        # Store the original signature pixmap if available, otherwise use current
-                        overlay_data['pixmap'] = getattr(child, 'original_pixmap', child.pixmap())
-                    elif mod_info['type'] == 'text':
-                        overlay_data['text'] = child.text()
-                        overlay_data['font_size'] = child.font().pointSize()
-                    
-                    overlays.append(overlay_data)
-                    print(f"Collected {mod_info['type']} overlay from page {page_num}")
+    def apply_overlays(self, editor):
+        """Add every signature and text overlay to an editor's modifications; returns the count"""
+        with tracing.span('collect overlays') as trace:
+            count = 0
+            for overlay in self.overlay_model.overlays():
+                # Overlays are already in PDF points, so they go to the editor unconverted
+                if overlay.type == 'signature' and overlay.strokes and editor.vector_signatures:
+                    # Drawn as PDF paths, sharp at any zoom and smaller than an image
+                    editor.add_signature_strokes(overlay.strokes, overlay.page, overlay.rect())
+                elif overlay.type == 'signature':
+                    # Full-resolution signature; the editor downsamples it to its target DPI
+                    editor.add_signature_image(overlay.pixmap, overlay.page, overlay.rect())
+                elif overlay.type == 'text':
+                    editor.add_text_at(overlay.text, overlay.page, (overlay.x, overlay.y), overlay.font_size)
+                count += 1
+            trace.set(count=count)
+        return count
+    
+    def add_overlay(self, overlay):
+        """Add an overlay to the model and show it"""
+        self.overlay_model.add(overlay)
+        return self.create_overlay_view(overlay)
+    
+    def create_overlay_view(self, overlay):
+        """Create the label showing an overlay"""
+        if overlay.page >= len(self.page_labels):
+            return None  # Skip if page doesn't exist
+        label = DraggableLabel(self.page_labels[overlay.page])
+        label.viewer = self
+        label.overlay = overlay
         
-        return overlays
-    
-    def restore_overlays(self, overlays):
-        """Restore overlays after page recreation with proper scaling"""
-        for overlay in overlays:
-            page_num = overlay['page']
-            if page_num >= len(self.page_labels):
-                continue  # Skip if page doesn't exist
-                
-            page_label = self.page_labels[page_num]
-            
-            # Calculate position and size scaling
-            zoom_ratio = self.zoom_level / overlay['original_zoom']
-            scaled_pos = QPoint(
-                int(overlay['position'].x() * zoom_ratio),
-                int(overlay['position'].y() * zoom_ratio)
-            )
-            
-            if overlay['type'] == 'signature':
-                # Create signature overlay
-                sig_label = DraggableLabel(page_label)
-                
-                # Always scale from the original pixmap to prevent quality degradation
-                original_pixmap = overlay['pixmap']
-                
-                # Calculate target size based on current zoom
-                base_width = int(200 * self.zoom_level)
-                base_height = int(100 * self.zoom_level)
-                scaled_pixmap = original_pixmap.scaled(
-                    base_width, base_height,
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                )
-                
-                sig_label.setPixmap(scaled_pixmap)
-                # Preserve the original pixmap for future scaling
-                sig_label.original_pixmap = original_pixmap
-                sig_label.move(scaled_pos)
-                sig_label.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground, True)
-                sig_label.setStyleSheet("background: transparent;")
-                sig_label.show()
-                
-                sig_label.modification_info = {
-                    'type': 'signature',
-                    'page': page_num,
-                    'original_zoom': self.zoom_level  # Update to current zoom after restoration
-                }
-                
-            elif overlay['type'] == 'text':
-                # Create text overlay
-                text_label = DraggableLabel(page_label)
-                text_label.setText(overlay['text'])
-                
-                # Scale font size appropriately
-                font = QFont()
-                scaled_font_size = int(overlay['font_size'] * zoom_ratio)
-                font.setPointSize(max(8, scaled_font_size))  # Minimum font size
-                text_label.setFont(font)
-                
-                text_label.setStyleSheet("""
-                    color: black; 
-                    background-color: rgba(255, 255, 255, 200);
-                    padding: 2px;
-                    border: 1px solid rgba(0, 0, 0, 50);
-                """)
-                
-                text_label.adjustSize()
-                text_label.move(scaled_pos)
-                text_label.show()
-                
-                text_label.modification_info = {
-                    'type': 'text',
-                    'page': page_num,
-                    'original_zoom': self.zoom_level  # Update to current zoom after restoration
-                }
-            
-            print(f"Restored {overlay['type']} overlay on page {page_num} at zoom {self.zoom_level:.2f}")
+        if overlay.type == 'signature':
+            # The full-resolution signature is scaled to the label's size when painted
+            label.setPixmap(overlay.pixmap)
+            label.setScaledContents(True)
+            # Make background transparent
+            label.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground, True)
+            label.setStyleSheet("background: transparent;")
+            
+        elif overlay.type == 'text':
+            label.setText(overlay.text)
+            
+            # Set style with semi-transparent background
+            label.setStyleSheet("""
+                color: black; 
+                background-color: rgba(255, 255, 255, 200);
+                padding: 2px;
+                border: 1px solid rgba(0, 0, 0, 50);
+            """)
         
+        self.place_overlay_view(label)
+        label.show()
+        self.overlay_views[overlay.id] = label
+        return label
+    
+    def place_overlay_view(self, label):
+        """Project an overlay label's PDF-point position and size to pixels at the current zoom"""
+        overlay = label.overlay
+        scale = self.scale_factor * self.zoom_level
+        if overlay.type == 'signature':
+            label.setGeometry(round(overlay.x * scale), round(overlay.y * scale),
+                              max(1, round(overlay.width * scale)), max(1, round(overlay.height * scale)))
+        elif overlay.type == 'text':
+            font = label.font()
+            font.setPointSizeF(max(8.0, overlay.font_size * self.zoom_level))  # Minimum font size
+            label.setFont(font)
+            label.adjustSize()
+            label.move(round(overlay.x * scale), round(overlay.y * scale))
+    
+    def sync_overlay(self, label, **changes):
+        """Copy an overlay label's position and content back into the model after an edit"""
+        # changes holds fields the label cannot show, e.g. the strokes of a redrawn signature
+        overlay = label.overlay
+        scale = self.scale_factor * self.zoom_level
+        changes.update(x=label.x() / scale, y=label.y() / scale)
+        if overlay.type == 'signature':
+            changes['width'] = label.width() / scale
+            changes['height'] = label.height() / scale
+            changes['pixmap'] = label.pixmap()
+        elif overlay.type == 'text':
+            changes['text'] = label.text()
+        self.overlay_model.update(overlay, **changes)
+    
+    def remove_overlay(self, label):
+        """Delete an overlay and its label"""
+        self.overlay_model.remove(label.overlay)
+        self.overlay_views.pop(label.overlay.id, None)
+        label.deleteLater()
+    
     def load_pdf(self, file_path, preserve_overlays=True):
-        """Load and display a PDF file"""
-        try:
-            # Store current file path
-            self.current_file = file_path
-            
-            # Collect existing overlays before clearing if preserving
-            collected_overlays = []
-            if preserve_overlays and self.page_labels:
-                collected_overlays = self.collect_overlays()
-                print(f"Collected {len(collected_overlays)} overlays to preserve")
-            
-            # Clear existing pages
-            self.clear_pages()
-            
-            # Open the PDF document
-            self.current_doc = fitz.open(file_path)
-            print(f"Opened PDF with {len(self.current_doc)} pages")
-            
-            # Render each page
-            for page_num in range(len(self.current_doc)):
-                page = self.current_doc[page_num]
-                
-                # Render page at scale_factor zoom
-                render_scale = self.scale_factor * self.zoom_level
-                pix = page.get_pixmap(matrix=fitz.Matrix(render_scale, render_scale))
-                
-                # Convert to QPixmap
-                img = QPixmap.fromImage(QImage(pix.samples, 
-                                               pix.width, 
-                                               pix.height, 
-                                               pix.stride, 
-                                               QImage.Format.Format_RGB888))
-                
-                # Create container for the page
-                page_container = QWidget()
-                page_container.setFixedSize(img.width(), img.height())
+        """Load and display a PDF from a DocumentSession, a file path or in-memory bytes"""
+        with tracing.span('open') as trace:
+            try:
+                # Store current file path
+                self.current_file = file_path.source if isinstance(file_path, DocumentSession) else file_path
+            
+                # Overlays of the previous document are kept in the model only if preserving
+                if not preserve_overlays:
+                    self.overlay_model.clear()
+            
+                # Clear existing pages
+                self.clear_pages()
+            
+                # Open the PDF document, unless the caller shares its session
+                if isinstance(file_path, DocumentSession):
+                    self.session = file_path
+                else:
+                    self.session = DocumentSession(file_path)
+                self.current_doc = self.session.document
+                self.renderer.set_document(self.session)
+                self.doc_key = self.session.key
+                print(f"Opened PDF with {self.session.page_count} pages")
+                trace.set(pages=self.session.page_count)
+            
+                # Lay out one placeholder per page, sized from the page rectangle
+                self.page_rects.extend(self.session.page_rects())
+                for page_num in range(self.session.page_count):
+                    # Create container for the page
+                    page_container = QWidget()
                 
-                # Create clickable label for the page
-                label = ClickableLabel(self, page_num)
-                label.setPixmap(img)
-                label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                label.setParent(page_container)
-                label.setGeometry(0, 0, img.width(), img.height())
+                    # Create clickable label for the page (white until rendered)
+                    label = ClickableLabel(self, page_num)
+                    label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+                    label.setScaledContents(True)  # Stretch previews and zoomed pixmaps to fit
+                    label.setStyleSheet("background-color: white;")
+                    label.setParent(page_container)
                 
-                # Add to lists
-                self.pages.append(page_container)
-                self.page_labels.append(label)
-                self.layout.addWidget(page_container)
+                    # Add to lists
+                    self.pages.append(page_container)
+                    self.page_labels.append(label)
+                    self.layout.addWidget(page_container)
                 
-                # Add spacing between pages
-                if page_num < len(self.current_doc) - 1:
-                    spacer = QWidget()
-                    spacer.setFixedHeight(20)
-                    self.layout.addWidget(spacer)
-                    
-            print(f"Successfully loaded {len(self.pages)} pages at zoom {self.zoom_level:.2f}")
+                    # Add spacing between pages
+                    if page_num < self.session.page_count - 1:
+                        spacer = QWidget()
+                        spacer.setFixedHeight(20)
+                        self.layout.addWidget(spacer)
             
-            # Restore overlays if any were collected
-            if collected_overlays:
-                self.restore_overlays(collected_overlays)
-                print(f"Restored {len(collected_overlays)} overlays")
+                self.update_page_geometry()
             
-        except Exception as e:
-            self.clear_pages()
-            error_msg = f"Error loading PDF: {str(e)}\n\n{traceback.format_exc()}"
-            QMessageBox.critical(self, "Error", error_msg)
-            print(error_msg)
-            raise
+                # Render once the scroll area has picked up the new content size
+                QTimer.singleShot(0, self.update_visible_pages)
+                    
+                print(f"Successfully loaded {len(self.pages)} pages at zoom {self.zoom_level:.2f}")
+            
+                # Recreate the labels of preserved overlays
+                if len(self.overlay_model):
+                    for overlay in self.overlay_model.overlays():
+                        self.create_overlay_view(overlay)
+                    print(f"Restored {len(self.overlay_model)} overlays")
+            
+            except Exception as e:
+                self.clear_pages()
+                error_msg = f"Error loading PDF: {str(e)}\n\n{traceback.format_exc()}"
+                QMessageBox.critical(self, "Error", error_msg)
+                print(error_msg)
+                raise
+    
+    def update_page_geometry(self):
+        """Size every page placeholder for the current zoom level"""
+        render_scale = self.scale_factor * self.zoom_level
+        matrix = fitz.Matrix(render_scale, render_scale)
+        spacing = self.layout.spacing()
+        y = self.layout.contentsMargins().top()
+        self.page_tops = []
+        for page_container, label, page_rect in zip(self.pages, self.page_labels, self.page_rects):
+            size = (page_rect * matrix).round()
+            page_container.setFixedSize(size.width, size.height)
+            label.setGeometry(0, 0, size.width, size.height)
+            self.page_tops.append(y)
+            y += size.height + spacing + 20 + spacing
+    
+    def page_render_scale(self, page_num):
+        """Scale whole-page pixmaps are rendered at; tiled pages get a low-resolution backdrop"""
+        render_scale = self.scale_factor * self.zoom_level
+        page_rect = self.page_rects[page_num]
+        page_pixels = page_rect.width * page_rect.height * render_scale * render_scale
+        if page_pixels > self.max_page_pixels:
+            # Tiles provide the detail, so the backdrop only has to fill in while they
+            # arrive; it stays within max_page_pixels even for poster-sized pages
+            render_scale = min(self.scale_factor, render_scale * (self.max_page_pixels / page_pixels) ** 0.5)
+        return render_scale
+    
+    def is_tiled(self, page_num):
+        """Whether a page needs tiles on top of its capped whole-page pixmap"""
+        return self.page_render_scale(page_num) < self.scale_factor * self.zoom_level
+    
+    def cache_key(self, page_num, tile=None):
+        """Render cache key of a page, or one of its tiles, at the current zoom level"""
+        if tile is None:
+            return RenderCache.make_key(self.doc_key, page_num, self.page_render_scale(page_num))
+        return RenderCache.make_key(self.doc_key, page_num, self.scale_factor * self.zoom_level, tile)
+    
+    def render_page(self, page_num):
+        """Show a page from the cache, or request it from the background renderer"""
+        if page_num in self.rendered_pages or not self.current_doc:
+            return
+        self.rendered_pages.add(page_num)
+        cached = self.render_cache.get(self.cache_key(page_num))
+        if cached is not None:
+            self.page_labels[page_num].setPixmap(cached)
+            self.final_pages.add(page_num)
+            return
+        # A page still showing its pixmap from the previous zoom level needs no preview
+        needs_preview = self.page_labels[page_num].pixmap().isNull()
+        self.renderer.request(page_num, self.page_render_scale(page_num), preview=needs_preview)
+    
+    def on_page_rendered(self, page_num, scale, final, image):
+        """Show a finished page image delivered by the renderer"""
+        if page_num not in self.rendered_pages or page_num in self.final_pages:
+            return  # Released meanwhile, or the full-resolution image is already shown
+        if scale != self.page_render_scale(page_num):
+            return  # Rendered for a previous zoom level
+        pixmap = QPixmap.fromImage(image)  # Shares the image's pixels
+        self.page_labels[page_num].setPixmap(pixmap)
+        if final:
+            self.final_pages.add(page_num)
+            self.render_cache.put(self.cache_key(page_num), pixmap)
+    
+    def update_visible_tiles(self):
+        """Request tiles covering the visible part of tiled pages and drop the rest"""
+        if not self.current_doc or not self.page_tops:
+            return
+        first, last = self.visible_page_range()
+        viewport_rect = self.viewport().rect()
+        render_scale = self.scale_factor * self.zoom_level
+        inverse = ~fitz.Matrix(render_scale, render_scale)
+        
+        for page_num in range(first, last + 1):
+            if not self.is_tiled(page_num):
+                continue
+            label = self.page_labels[page_num]
+            
+            # Visible part of the page in label pixels, grown by one tile as a margin
+            visible = QRect(label.mapFrom(self.viewport(), viewport_rect.topLeft()),
+                            viewport_rect.size()).intersected(label.rect())
+            visible.adjust(-self.tile_size, -self.tile_size, self.tile_size, self.tile_size)
+            visible = visible.intersected(label.rect())
+            if visible.isEmpty():
+                continue
+            
+            wanted = set()
+            for row in range(visible.top() // self.tile_size, visible.bottom() // self.tile_size + 1):
+                for column in range(visible.left() // self.tile_size, visible.right() // self.tile_size + 1):
+                    tile = (column, row)
+                    wanted.add(tile)
+                    if tile in label.tiles:
+                        continue
+                    target = QRect(column * self.tile_size, row * self.tile_size,
+                                   self.tile_size, self.tile_size).intersected(label.rect())
+                    cached = self.render_cache.get(self.cache_key(page_num, tile))
+                    if cached is not None:
+                        label.tiles[tile] = (target, cached)
+                        label.update(target)
+                    else:
+                        # Mark as pending so the tile is only requested once
+                        label.tiles[tile] = (target, QPixmap())
+                        clip = fitz.Rect(target.left(), target.top(),
+                                         target.right() + 1, target.bottom() + 1) * inverse
+                        self.renderer.request_tile(page_num, render_scale, tile, clip)
+            
+            for tile in list(label.tiles):
+                if tile not in wanted:
+                    del label.tiles[tile]
+    
+    def on_tile_rendered(self, page_num, scale, column, row, image):
+        """Show a finished tile delivered by the renderer"""
+        if page_num not in self.rendered_pages or scale != self.scale_factor * self.zoom_level:
+            return
+        label = self.page_labels[page_num]
+        tile = (column, row)
+        if tile not in label.tiles:
+            return  # Scrolled away meanwhile
+        target = label.tiles[tile][0]
+        pixmap = QPixmap.fromImage(image)
+        label.tiles[tile] = (target, pixmap)
+        self.render_cache.put(self.cache_key(page_num, tile), pixmap)
+        label.update(target)
+    
+    def release_page(self, page_num):
+        """Drop the pixmap of an offscreen page, keeping its placeholder"""
+        if page_num in self.rendered_pages:
+            self.page_labels[page_num].clear()
+            self.page_labels[page_num].tiles.clear()
+            self.rendered_pages.discard(page_num)
+            self.final_pages.discard(page_num)
+            self.renderer.discard(page_num)
+    
+    def visible_page_range(self):
+        """Return the (first, last) indices of pages intersecting the viewport"""
+        if not self.page_tops:
+            return None
+        top = self.verticalScrollBar().value()
+        bottom = top + self.viewport().height()
+        first = max(0, bisect.bisect_right(self.page_tops, top) - 1)
+        last = max(first, bisect.bisect_right(self.page_tops, bottom) - 1)
+        return first, last
+    
+    def update_visible_pages(self):
+        """Render pages in or near the viewport and release the rest"""
+        if not self.current_doc or not self.page_labels:
+            return
+        if self.lazy_rendering:
+            visible = self.visible_page_range()
+            first = max(0, visible[0] - self.render_window)
+            last = min(len(self.page_labels) - 1, visible[1] + self.render_window)
+        else:
+            first, last = 0, len(self.page_labels) - 1
+        
+        for page_num in list(self.rendered_pages):
+            if page_num < first or page_num > last:
+                self.release_page(page_num)
+        for page_num in range(first, last + 1):
+            self.render_page(page_num)
+        self.update_visible_tiles()
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_visible_pages()
     
     def zoom(self, factor):
         """Zoom in or out by the given factor"""
         new_zoom = self.zoom_level * factor
         # Clamp zoom between 25% and 400%
         new_zoom = max(0.25, min(new_zoom, 4.0))
+        self.set_zoom(new_zoom)
+    
+    def set_zoom(self, new_zoom):
+        """Switch to a new zoom level without reopening the document"""
+        if new_zoom == self.zoom_level:
+            return
+        ratio = new_zoom / self.zoom_level
         
-        if new_zoom != self.zoom_level:
-            # Store scroll position
-            v_scroll = self.verticalScrollBar().value()
-            h_scroll = self.horizontalScrollBar().value()
-            v_max = self.verticalScrollBar().maximum()
-            h_max = self.horizontalScrollBar().maximum()
-            
-            # Calculate relative position
-            v_relative = v_scroll / v_max if v_max > 0 else 0
-            h_relative = h_scroll / h_max if h_max > 0 else 0
-            
-            self.zoom_level = new_zoom
-            self.zoom_changed.emit(self.zoom_level)
-            
-            if self.current_file:
-                # Reload at new zoom
-                self.load_pdf(self.current_file)
-                
-                # Restore approximate scroll position
-                QApplication.processEvents()  # Let layout update
-                new_v_max = self.verticalScrollBar().maximum()
-                new_h_max = self.horizontalScrollBar().maximum()
-                self.verticalScrollBar().setValue(int(v_relative * new_v_max))
-                self.horizontalScrollBar().setValue(int(h_relative * new_h_max))
-            
-            print(f"Zoom level: {self.zoom_level:.2f}x ({int(self.zoom_level * 100)}%)")
+        # Anchor the page point at the viewport center so it stays in place
+        anchor = None
+        if self.page_tops:
+            center_y = self.verticalScrollBar().value() + self.viewport().height() / 2
+            anchor_page = min(max(0, bisect.bisect_right(self.page_tops, center_y) - 1),
+                              len(self.page_tops) - 1)
+            anchor = (anchor_page, center_y - self.page_tops[anchor_page])
+        h_center = self.horizontalScrollBar().value() + self.viewport().width() / 2
+        
+        self.zoom_level = new_zoom
+        self.zoom_changed.emit(self.zoom_level)
+        
+        with tracing.span('zoom', zoom=new_zoom, overlays=len(self.overlay_views)):
+            if self.current_doc:
+                # Outstanding renders are for the old scale
+                self.renderer.cancel()
+                stale_pages = self.rendered_pages
+                self.rendered_pages = set()
+                self.final_pages.clear()
+                for page_num in stale_pages:
+                    self.page_labels[page_num].tiles.clear()
+            
+                # Resize placeholders; existing pixmaps stretch as an instant preview
+                self.update_page_geometry()
+                self.layout_overlays()
+            
+                # Apply the new content size right away so the scroll range fits it
+                self.layout.activate()
+                self.container.resize(self.container.sizeHint().expandedTo(self.viewport().size()))
+                if anchor is not None:
+                    anchor_page, offset = anchor
+                    self.verticalScrollBar().setValue(
+                        int(self.page_tops[anchor_page] + offset * ratio - self.viewport().height() / 2))
+                self.horizontalScrollBar().setValue(int(h_center * ratio - self.viewport().width() / 2))
+            
+                # Re-rasterize what is visible; drop stretched pixmaps that scrolled away
+                self.update_visible_pages()
+                for page_num in stale_pages - self.rendered_pages:
+                    self.page_labels[page_num].clear()
+        
+        print(f"Zoom level: {self.zoom_level:.2f}x ({int(self.zoom_level * 100)}%)")
     
     def reset_zoom(self):
         """Reset zoom to 100%"""
         if self.zoom_level != 1.0:
-            self.zoom_level = 1.0
-            self.zoom_changed.emit(self.zoom_level)
-            if self.current_file:
-                self.load_pdf(self.current_file)
+            self.set_zoom(1.0)
             print("Zoom reset to 100%")
-            
+    
+    def layout_overlays(self):
+        """Reposition overlay labels after a zoom change; the overlays themselves are unchanged"""
+        for label in self.overlay_views.values():
+            self.place_overlay_view(label)
+    
     def clear_pages(self):
         """Clear all pages from the viewer"""
         # Remove all widgets from layout
@@ -372,20 +612,33 @@ class PDFViewer(QScrollArea):
             if item.widget():
                 item.widget().deleteLater()
                 
-        # Clear lists
+        # Clear lists (overlay labels were children of the pages)
         self.pages.clear()
         self.page_labels.clear()
-        
+        self.overlay_views.clear()
+        self.rendered_pages.clear()
+        self.final_pages.clear()
+        self.page_tops.clear()
+        self.page_rects.clear()
+        self.renderer.release_document()  # Render threads close their copies of the document
+
+        # Drop the document's cached pages and tiles; in-memory merges never reuse a key
+        if self.doc_key is not None:
+            self.render_cache.invalidate(self.doc_key)
+            self.doc_key = None
+
         # Close document if open
-        if self.current_doc:
-            self.current_doc.close()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
             self.current_doc = None
             
-    def enable_signature_mode(self, signature_image):
+    def enable_signature_mode(self, signature_image, strokes=None):
         """Enable signature placement mode"""
         self.signature_mode = True
         self.text_mode = False
         self.current_signature = signature_image
+        self.current_signature_strokes = strokes
         self.setCursor(QCursor(Qt.CursorShape.CrossCursor))
         QMessageBox.information(self, "Add Signature", 
                               "Click where you want to place the signature.\n"
@@ -407,41 +660,24 @@ class PDFViewer(QScrollArea):
     def handle_click(self, event, page_num):
         """Handle clicks on PDF pages"""
         if self.signature_mode and self.current_signature:
-            # Add signature at click position
+            # Add signature centered on the click position, converted to PDF points
             pos = event.pos()
-            parent_widget = self.page_labels[page_num]
-            
-            # Create draggable signature label
-            sig_label = DraggableLabel(parent_widget)
-            
-            # Scale signature based on zoom level
-            base_width = int(200 * self.zoom_level)
-            base_height = int(100 * self.zoom_level)
-            scaled_signature = self.current_signature.scaled(
-                base_width, base_height,
-                Qt.AspectRatioMode.KeepAspectRatio, 
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            sig_label.setPixmap(scaled_signature)
-            # Store the original unscaled signature for quality preservation
-            sig_label.original_pixmap = self.current_signature
+            scale = self.scale_factor * self.zoom_level
             
-            # Position signature centered on click point
-            sig_label.move(pos.x() - scaled_signature.width() // 2, 
-                          pos.y() - scaled_signature.height() // 2)
-            
-            # Make background transparent
-            sig_label.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground, True)
-            sig_label.setStyleSheet("background: transparent;")
-            sig_label.show()
-            
-            # Store modification info
-            sig_label.modification_info = {
-                'type': 'signature',
-                'page': page_num,
-                'original_zoom': self.zoom_level
-            }
+            # Default box is 200x100 pixels at 100% zoom, keeping the signature's aspect ratio
+            size = QSizeF(self.current_signature.size()).scaled(
+                200 / self.scale_factor, 100 / self.scale_factor,
+                Qt.AspectRatioMode.KeepAspectRatio
+            )
+            self.add_overlay(Overlay(
+                'signature', page_num,
+                pos.x() / scale - size.width() / 2,
+                pos.y() / scale - size.height() / 2,
+                size.width(), size.height(),
+                # Original unscaled signature, for quality preservation
+                pixmap=self.current_signature,
+                strokes=self.current_signature_strokes
+            ))
             
             print(f"Added signature to page {page_num} at position ({pos.x()}, {pos.y()})")
             
@@ -454,38 +690,14 @@ class PDFViewer(QScrollArea):
             text, ok = QInputDialog.getText(self, "Add Text", "Enter your text:")
             if ok and text:
                 pos = event.pos()
-                parent_widget = self.page_labels[page_num]
-                
-                # Create draggable text label
-                text_label = DraggableLabel(parent_widget)
-                text_label.setText(text)
-                
-                # Set font scaled by zoom
-                font = QFont()
-                font.setPointSize(int(14 * self.zoom_level))
-                text_label.setFont(font)
-                
-                # Set style with semi-transparent background
-                text_label.setStyleSheet("""
-                    color: black; 
-                    background-color: rgba(255, 255, 255, 200);
-                    padding: 2px;
-                    border: 1px solid rgba(0, 0, 0, 50);
-                """)
-                
-                # Adjust size to fit text
-                text_label.adjustSize()
-                
-                # Position at click point
-                text_label.move(pos.x(), pos.y())
-                text_label.show()
                 
-                # Store modification info
-                text_label.modification_info = {
-                    'type': 'text',
-                    'page': page_num,
-                    'original_zoom': self.zoom_level
-                }
+                # Positioned at the click point, in PDF points
+                scale = self.scale_factor * self.zoom_level
+                self.add_overlay(Overlay(
+                    'text', page_num,
+                    pos.x() / scale, pos.y() / scale,
+                    text=text, font_size=14
+                ))
                 
                 print(f"Added text to page {page_num} at position ({pos.x()}, {pos.y()})")
                 
@@ -494,10 +706,13 @@ class PDFViewer(QScrollArea):
                 self.setCursor(QCursor(Qt.CursorShape.ArrowCursor))
 
     def print_pdf(self):
-        """Print the PDF with modifications properly composited"""
+        """Print the PDF with modifications, rendered at printer resolution on a worker thread"""
         if not self.current_doc:
             QMessageBox.warning(self, "Print Error", "Please open a PDF file first.")
             return
+        if self.print_job is not None:
+            QMessageBox.information(self, "Printing", "A document is already being printed.")
+            return
 
         try:
             from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
@@ -507,8 +722,8 @@ class PDFViewer(QScrollArea):
             printer = QPrinter(QPrinter.PrinterMode.HighResolution)
             
             # Detect and set page size from first page
-            if len(self.current_doc) > 0:
-                page_rect = self.current_doc[0].rect
+            if self.session.page_count > 0:
+                page_rect = self.session.page_rects()[0]
                 width_pt = page_rect.width
                 height_pt = page_rect.height
                 
@@ -531,103 +746,113 @@ class PDFViewer(QScrollArea):
             if dialog.exec() != QPrintDialog.DialogCode.Accepted:
                 return
 
-            # Show progress
-            progress_dialog = QMessageBox(QMessageBox.Icon.Information, 
-                                          "Printing", 
-                                          "Preparing document for printing...",
-                                          QMessageBox.StandardButton.NoButton, self)
-            progress_dialog.show()
+            # Overlays are inserted into a private copy of the document, exactly as
+            # when saving, so the printout matches the saved PDF
+            editor = PDFEditor()
+            editor.set_current_pdf(self.current_file, scale_factor=self.scale_factor, session=self.session)
+            self.apply_overlays(editor)
+            dpi = min(printer.resolution(), self.print_dpi)
+            page_count = self.session.page_count
 
             # Start painting
             painter = QPainter()
             if not painter.begin(printer):
                 raise Exception("Failed to initialize printer")
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
 
-            try:
-                printer_rect = printer.pageRect(QPrinter.Unit.DevicePixel)
-                
-                # Print each page with composited overlays
-                for page_num, page_label in enumerate(self.page_labels):
-                    if page_num > 0:
-                        printer.newPage()
-
-                    # Get base page pixmap
-                    base_pixmap = page_label.pixmap()
-                    if base_pixmap is None:
-                        continue
+            progress = QProgressDialog("Preparing document for printing...", "Cancel", 0, page_count, self)
+            progress.setWindowTitle("Printing")
+            progress.setWindowModality(Qt.WindowModality.WindowModal)
+            progress.setMinimumDuration(0)
+            progress.setAutoReset(False)
+            progress.setValue(0)
 
-                    # Create a composite pixmap with all overlays
-                    composite = QPixmap(base_pixmap.size())
-                    composite.fill(Qt.GlobalColor.transparent)
-                    
-                    # Create painter for composite
-                    composite_painter = QPainter(composite)
-                    composite_painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
-                    composite_painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
-                    
-                    # Draw base PDF page
-                    composite_painter.drawPixmap(0, 0, base_pixmap)
-                    
-                    # Draw all overlays (signatures and text) onto composite
-                    for child in page_label.children():
-                        if isinstance(child, DraggableLabel) and hasattr(child, 'modification_info'):
-                            mod_info = child.modification_info
-                            
-                            if mod_info['type'] == 'signature':
-                                # Draw signature with transparency
-                                sig_pixmap = child.pixmap()
-                                if sig_pixmap:
-                                    composite_painter.setCompositionMode(
-                                        QPainter.CompositionMode.CompositionMode_SourceOver
-                                    )
-                                    composite_painter.drawPixmap(child.pos(), sig_pixmap)
-                                    
-                            elif mod_info['type'] == 'text':
-                                # Draw text
-                                composite_painter.setPen(Qt.GlobalColor.black)
-                                composite_painter.setFont(child.font())
-                                
-                                # Draw text background if needed
-                                text_rect = child.rect().translated(child.pos())
-                                composite_painter.fillRect(text_rect, 
-                                                          QColor(255, 255, 255, 200))
-                                
-                                # Draw text
-                                composite_painter.drawText(text_rect, 
-                                                          Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
-                                                          child.text())
-                    
-                    composite_painter.end()
-                    
-                    # Now scale and print the composite image
-                    scaled_composite = composite.scaled(
-                        int(printer_rect.width()),
-                        int(printer_rect.height()),
-                        Qt.AspectRatioMode.KeepAspectRatio,
-                        Qt.TransformationMode.SmoothTransformation
-                    )
-                    
-                    # Center on page
-                    x = (printer_rect.width() - scaled_composite.width()) / 2
-                    y = (printer_rect.height() - scaled_composite.height()) / 2
-                    
-                    # Draw the composite to printer
-                    painter.drawPixmap(int(x), int(y), scaled_composite)
-                                
-            finally:
-                painter.end()
-                progress_dialog.close()
-
-            QMessageBox.information(self, "Success", "Document sent to printer successfully!")
-            print("PDF printed successfully with all overlays")
+            job = {
+                'printer': printer,
+                'painter': painter,
+                'progress': progress,
+                'page_count': page_count,
+                'pages_printed': 0,
+                'slots': threading.Semaphore(self.print_queue_pages),
+            }
+            job['task'] = BackgroundTask(editor.render_for_print, dpi,
+                                         functools.partial(self._queue_print_page, job))
+            job['task'].finished.connect(self.on_print_finished)
+            job['task'].failed.connect(self.on_print_failed)
+            progress.canceled.connect(job['task'].cancel)
+            self.print_job = job
+            job['task'].start()
+            print(f"Printing {page_count} pages at {dpi} dpi")
 
         except Exception as e:
             error_msg = f"Printing error: {str(e)}\n\n{traceback.format_exc()}"
             QMessageBox.critical(self, "Print Error", error_msg)
             print(error_msg)
-
-# Import QApplication for zoom
-from PyQt6.QtWidgets import QApplication
+    
+    def _queue_print_page(self, job, page_num, image):
+        """Print worker: hand a rendered page to the GUI thread"""
+        # Blocks while print_queue_pages pages are still waiting, so memory stays bounded
+        while not job['slots'].acquire(timeout=0.1):
+            if job['task'].is_cancelled():
+                return
+        self._print_page_ready.emit(page_num, image)
+    
+    def on_print_page(self, page_num, image):
+        """GUI thread: paint one rendered page onto the printer"""
+        job = self.print_job
+        if job is None:
+            return
+        try:
+            if job['task'].is_cancelled():
+                return
+            with tracing.span('print paint page', page=page_num):
+                printer = job['printer']
+                if job['pages_printed'] > 0:
+                    printer.newPage()
+            
+                # Scale to the printable area, keeping the aspect ratio, and center it
+                from PyQt6.QtPrintSupport import QPrinter
+                printer_rect = printer.pageRect(QPrinter.Unit.DevicePixel)
+                target = image.size().scaled(int(printer_rect.width()), int(printer_rect.height()),
+                                             Qt.AspectRatioMode.KeepAspectRatio)
+                x = (printer_rect.width() - target.width()) / 2
+                y = (printer_rect.height() - target.height()) / 2
+                job['painter'].drawImage(QRect(int(x), int(y), target.width(), target.height()), image)
+            
+            job['pages_printed'] += 1
+            job['progress'].setValue(job['pages_printed'])
+            job['progress'].setLabelText(f"Printing page {job['pages_printed']} of {job['page_count']}...")
+        finally:
+            job['slots'].release()
+    
+    def finish_print_job(self, aborted):
+        """End the print job; an aborted job is discarded instead of being sent to the printer"""
+        job = self.print_job
+        self.print_job = None
+        if aborted:
+            job['printer'].abort()
+        job['painter'].end()
+        job['progress'].close()
+    
+    def on_print_finished(self, pages):
+        """GUI thread: the print worker is done"""
+        if self.print_job is None:
+            return
+        if pages is None or self.print_job['task'].is_cancelled():
+            self.finish_print_job(aborted=True)
+            print("Printing cancelled")
+            return
+        self.finish_print_job(aborted=False)
+        QMessageBox.information(self, "Success", "Document sent to printer successfully!")
+        print("PDF printed successfully with all overlays")
+    
+    def on_print_failed(self, error):
+        """GUI thread: the print worker raised"""
+        if self.print_job is None:
+            return
+        self.finish_print_job(aborted=True)
+        QMessageBox.critical(self, "Print Error", f"Printing error: {error}")
+        print(f"Printing error: {error}")
 
 # Export classes
 __all__ = ['PDFViewer', 'DraggableLabel']
\ No newline at end of file
@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import itertools
+import os
+import tracing
+
+# In-memory documents have no path to identify them, so each gets a fresh id
+_memory_ids = itertools.count(1)
+
+def document_key(file_path):
+    """Identify a document by path, modification time and size"""
+    # Including mtime/size means an overwritten file never hits stale entries
+    if isinstance(file_path, (bytes, bytearray)):
+        return ('<memory>', next(_memory_ids), len(file_path))
+    try:
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (os.path.abspath(file_path), None, None)
+
+class RenderCache:
+    """Memory-bounded LRU cache of rendered page pixmaps"""
+    # Keys are (document key, page number, effective scale, tile or None). Only
+    # used from the GUI thread, since QPixmaps cannot be touched from worker threads.
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (pixmap, size in bytes), oldest first
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(doc_key, page_num, scale, tile=None):
+        """Build a cache key; the scale is rounded so float noise still hits"""
+        return (doc_key, page_num, round(scale, 4), tile)
+
+    @staticmethod
+    def pixmap_bytes(pixmap):
+        """Approximate memory held by a pixmap"""
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def get(self, key):
+        """Return the cached pixmap for key, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, pixmap):
+        """Store a pixmap, evicting least recently used entries to stay in budget"""
+        size = self.pixmap_bytes(pixmap)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        if key in self.entries:
+            self.current_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (pixmap, size)
+        self.current_bytes += size
+        self._evict_to_budget()
+        tracing.counter('render cache', bytes=self.current_bytes, entries=len(self.entries))
+
+    def invalidate(self, doc_key=None, page_num=None):
+        """Drop entries for a document and/or page; with no arguments, drop everything"""
+        if doc_key is None and page_num is None:
+            self.entries.clear()
+            self.current_bytes = 0
+            return
+        for key in list(self.entries):
+            if doc_key is not None and key[0] != doc_key:
+                continue
+            if page_num is not None and key[1] != page_num:
+                continue
+            self.current_bytes -= self.entries.pop(key)[1]
+
+    def set_max_bytes(self, max_bytes):
+        """Change the byte budget, evicting entries if it shrank"""
+        self.max_bytes = max_bytes
+        self._evict_to_budget()
+
+    def _evict_to_budget(self):
+        """Evict least recently used entries until the budget is met"""
+        while self.current_bytes > self.max_bytes and self.entries:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss counters and current memory use"""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+# Export classes
+__all__ = ['RenderCache', 'document_key']
@@ -1,6 +1,163 @@
-from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QMessageBox)
-from PyQt6.QtCore import Qt, QPoint
-from PyQt6.QtGui import QPixmap, QPainter, QPen, QColor, QBrush
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QMessageBox,
+                             QWidget)
+from PyQt6.QtCore import Qt, QPointF, QRectF, QEvent, pyqtSignal
+from PyQt6.QtGui import QPixmap, QPainter, QPen, QColor, QBrush, QPolygonF
+import time
+
+def simplify_stroke(points, tolerance):
+    """Drop points closer than tolerance to the line through their neighbours (Douglas-Peucker)"""
+    # points are (x, y, t) tuples; the first and last are always kept
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(points) - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        x0, y0 = points[first][:2]
+        x1, y1 = points[last][:2]
+        dx, dy = x1 - x0, y1 - y0
+        length = (dx * dx + dy * dy) ** 0.5
+        farthest, farthest_distance = None, tolerance
+        for i in range(first + 1, last):
+            x, y = points[i][:2]
+            if length:
+                distance = abs(dy * (x - x0) - dx * (y - y0)) / length
+            else:
+                distance = ((x - x0) ** 2 + (y - y0) ** 2) ** 0.5
+            if distance > farthest_distance:
+                farthest, farthest_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            ranges.append((first, farthest))
+            ranges.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+class SignatureCanvas(QWidget):
+    """Drawing surface of the signature pad; repaints only the area new stroke segments touch"""
+    # Input handlers only record points and mark their bounding rectangle dirty.
+    # Qt merges the dirty rectangles of all events that arrive before the next
+    # paint, and paintEvent draws the recorded points onto the signature pixmap
+    # in one pass, so a burst of pen or touch samples costs a single repaint.
+    stroke_started = pyqtSignal()
+    _background = None  # Checkered pattern showing transparency, shared by all pads
+
+    def __init__(self, signature_pixmap, parent=None):
+        super().__init__(parent)
+        self.signature_pixmap = signature_pixmap
+        self.setFixedSize(signature_pixmap.size())
+        self.pen = QPen(QColor(0, 0, 100), 2.5, Qt.PenStyle.SolidLine,
+                        Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
+        self.border_pen = QPen(QColor(204, 204, 204), 2)
+        self.pending = []  # Polylines (lists of QPointF) not drawn onto the pixmap yet
+        self.drawing = False
+        self.last_point = QPointF()
+        # Every stroke as a list of (x, y, seconds since the first stroke began)
+        self.strokes = []
+        self.started = None
+
+    @classmethod
+    def background(cls, width, height):
+        """Checkered background, created once and reused for every repaint"""
+        if cls._background is None or cls._background.width() < width or cls._background.height() < height:
+            background = QPixmap(width, height)
+            background.fill(Qt.GlobalColor.white)
+            painter = QPainter(background)
+            painter.setBrush(QBrush(QColor(240, 240, 240)))
+            painter.setPen(Qt.PenStyle.NoPen)
+            square_size = 10
+            for i in range(0, width, square_size * 2):
+                for j in range(0, height, square_size * 2):
+                    painter.drawRect(i, j, square_size, square_size)
+                    painter.drawRect(i + square_size, j + square_size, square_size, square_size)
+            painter.end()
+            cls._background = background
+        return cls._background
+
+    def begin_stroke(self, point):
+        """Start a stroke at point (widget coordinates)"""
+        self.drawing = True
+        self.last_point = point
+        self.pending.append([point])
+        if self.started is None:
+            self.started = time.monotonic()
+        self.strokes.append([self.sample(point)])
+        self.stroke_started.emit()
+
+    def extend_stroke(self, point):
+        """Record the next point of the current stroke and schedule a repaint of its segment"""
+        if not self.drawing or point == self.last_point:
+            return
+        self.pending[-1].append(point)
+        self.strokes[-1].append(self.sample(point))
+        margin = self.pen.widthF() + 1
+        dirty = QRectF(self.last_point, point).normalized().adjusted(-margin, -margin, margin, margin)
+        self.last_point = point
+        self.update(dirty.toAlignedRect())
+
+    def sample(self, point):
+        """A recorded stroke point"""
+        return (point.x(), point.y(), time.monotonic() - self.started)
+
+    def end_stroke(self):
+        """Finish the current stroke"""
+        self.drawing = False
+
+    def flush_strokes(self):
+        """Draw recorded points onto the signature pixmap"""
+        if not self.pending:
+            return
+        painter = QPainter(self.signature_pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+        painter.setPen(self.pen)
+        for points in self.pending:
+            if len(points) > 1:
+                painter.drawPolyline(QPolygonF(points))
+        painter.end()
+        # The next segment of an unfinished stroke continues from its last point
+        self.pending = [[self.last_point]] if self.drawing else []
+
+    def clear(self):
+        """Erase the signature"""
+        self.pending = [[self.last_point]] if self.drawing else []
+        self.strokes = [[self.sample(self.last_point)]] if self.drawing else []
+        if not self.drawing:
+            self.started = None
+        self.signature_pixmap.fill(Qt.GlobalColor.transparent)
+        self.update()
+
+    def paintEvent(self, event):
+        self.flush_strokes()
+        rect = event.rect()
+        painter = QPainter(self)
+        painter.drawPixmap(rect, self.background(self.width(), self.height()), rect)
+        painter.drawPixmap(rect, self.signature_pixmap, rect)
+        painter.setPen(self.border_pen)
+        painter.setBrush(Qt.BrushStyle.NoBrush)
+        painter.drawRoundedRect(QRectF(self.rect()).adjusted(1, 1, -1, -1), 5, 5)
+        painter.end()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.begin_stroke(event.position())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.MouseButton.LeftButton:
+            self.extend_stroke(event.position())
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self.end_stroke()
+
+    def tabletEvent(self, event):
+        """Pen input: every sample, with sub-pixel positions; unlike mouse moves these are not compressed"""
+        if event.type() == QEvent.Type.TabletPress:
+            self.begin_stroke(event.position())
+        elif event.type() == QEvent.Type.TabletMove:
+            self.extend_stroke(event.position())
+        elif event.type() == QEvent.Type.TabletRelease:
+            self.end_stroke()
+        event.accept()  # Otherwise Qt also delivers it as a mouse event
 
 class SignaturePad(QDialog):
     """Dialog for drawing signatures with transparent background"""
@@ -20,35 +177,15 @@ class SignaturePad(QDialog):
         instructions.setAlignment(Qt.AlignmentFlag.AlignCenter)
         layout.addWidget(instructions)
         
-        # Create signature area with checkered background to show transparency
-        self.signature_label = QLabel()
-        self.signature_label.setFixedSize(380, 200)
-        
-        # Create a checkered background to visualize transparency
-        self.signature_label.setStyleSheet("""
-            QLabel {
-                border: 2px solid #cccccc;
-                border-radius: 5px;
-                background-color: #ffffff;
-                background-image: 
-                    repeating-linear-gradient(
-                        45deg,
-                        #f0f0f0,
-                        #f0f0f0 10px,
-                        #ffffff 10px,
-                        #ffffff 20px
-                    );
-            }
-        """)
-        
         # Initialize signature pixmap with TRANSPARENT background
         self.signature_pixmap = QPixmap(380, 200)
         self.signature_pixmap.fill(Qt.GlobalColor.transparent)  # Transparent background
         
-        # Create display pixmap with checkered pattern
-        self.update_display()
+        # Drawing area, painted over a checkered background to show transparency
+        self.signature_canvas = SignatureCanvas(self.signature_pixmap)
+        self.signature_canvas.stroke_started.connect(self.on_stroke_started)
         
-        layout.addWidget(self.signature_label, alignment=Qt.AlignmentFlag.AlignCenter)
+        layout.addWidget(self.signature_canvas, alignment=Qt.AlignmentFlag.AlignCenter)
         
         # Add buttons
         button_layout = QHBoxLayout()
@@ -124,94 +261,15 @@ class SignaturePad(QDialog):
         button_layout.addWidget(done_button)
         layout.addLayout(button_layout)
         
-        # Initialize drawing variables
-        self.last_point = QPoint()
-        self.drawing = False
         self.has_signature = False  # Track if user has drawn anything
         
-    def create_checkered_background(self):
-        """Create a checkered pattern background to show transparency"""
-        background = QPixmap(380, 200)
-        background.fill(Qt.GlobalColor.white)
-        
-        painter = QPainter(background)
-        brush = QBrush(QColor(240, 240, 240))
-        painter.setBrush(brush)
-        painter.setPen(Qt.PenStyle.NoPen)
-        
-        # Draw checkered pattern
-        square_size = 10
-        for i in range(0, 380, square_size * 2):
-            for j in range(0, 200, square_size * 2):
-                painter.drawRect(i, j, square_size, square_size)
-                painter.drawRect(i + square_size, j + square_size, square_size, square_size)
-        
-        painter.end()
-        return background
-        
-    def update_display(self):
-        """Update the display with signature over checkered background"""
-        # Create checkered background
-        display_pixmap = self.create_checkered_background()
-        
-        # Draw signature on top
-        painter = QPainter(display_pixmap)
-        painter.drawPixmap(0, 0, self.signature_pixmap)
-        painter.end()
-        
-        self.signature_label.setPixmap(display_pixmap)
-        
-    def mousePressEvent(self, event):
-        """Handle mouse press events"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            # Check if click is within signature area
-            label_pos = self.signature_label.pos()
-            label_rect = self.signature_label.rect().translated(label_pos)
-            
-            if label_rect.contains(event.pos()):
-                self.drawing = True
-                self.last_point = event.pos() - label_pos
-                self.has_signature = True
-            
-    def mouseMoveEvent(self, event):
-        """Handle mouse move events"""
-        if self.drawing and event.buttons() & Qt.MouseButton.LeftButton:
-            # Calculate current point relative to signature label
-            label_pos = self.signature_label.pos()
-            current_point = event.pos() - label_pos
-            
-            # Check if current point is within bounds
-            if (0 <= current_point.x() < self.signature_pixmap.width() and 
-                0 <= current_point.y() < self.signature_pixmap.height()):
-                
-                # Draw line on the transparent signature pixmap
-                painter = QPainter(self.signature_pixmap)
-                painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
-                
-                # Use a nice pen for smooth signature (dark blue/black)
-                pen = QPen(QColor(0, 0, 100), 2.5, Qt.PenStyle.SolidLine,
-                          Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin)
-                painter.setPen(pen)
-                
-                # Draw the line
-                painter.drawLine(self.last_point, current_point)
-                painter.end()
-                
-                # Update the display with checkered background
-                self.update_display()
-                
-                # Update last point
-                self.last_point = current_point
-            
-    def mouseReleaseEvent(self, event):
-        """Handle mouse release events"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            self.drawing = False
+    def on_stroke_started(self):
+        """Remember that something was drawn"""
+        self.has_signature = True
             
     def clear_signature(self):
         """Clear the signature pad"""
-        self.signature_pixmap.fill(Qt.GlobalColor.transparent)  # Clear to transparent
-        self.update_display()
+        self.signature_canvas.clear()  # Clear to transparent
         self.has_signature = False
         print("Signature cleared")
         
@@ -226,7 +284,25 @@ class SignaturePad(QDialog):
         
     def get_signature(self):
         """Get the signature pixmap with transparent background"""
+        self.signature_canvas.flush_strokes()  # Include points not painted yet
         return self.signature_pixmap
+    
+    def get_strokes(self, tolerance=0.25):
+        """Get the signature as vector strokes, or None if nothing was drawn"""
+        # Returned as a dict for PDFEditor.add_signature_strokes: 'size' of the pad in
+        # pixels, 'pen_width' and 'color' of the pen, and 'strokes', each a list of
+        # (x, y, t) pad coordinates simplified to within tolerance pixels
+        strokes = [simplify_stroke(stroke, tolerance)
+                   for stroke in self.signature_canvas.strokes if len(stroke) > 1]
+        if not strokes:
+            return None
+        pen = self.signature_canvas.pen
+        return {
+            'size': (self.signature_pixmap.width(), self.signature_pixmap.height()),
+            'pen_width': pen.widthF(),
+            'color': pen.color().getRgb()[:3],
+            'strokes': strokes,
+        }
 
-# Export class
-__all__ = ['SignaturePad']
\ No newline at end of file
+# Export classes
+__all__ = ['SignaturePad', 'SignatureCanvas']
\ No newline at end of file
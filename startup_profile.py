@@ -0,0 +1,60 @@
+import builtins
+import sys
+import time
+
+class StartupProfiler:
+    """Time module imports and startup milestones, for main.py --profile-startup"""
+    # Wraps builtins.__import__ while installed, recording how long each module
+    # takes to load the first time, including the modules it imports itself.
+    # Meant for the main thread during startup only; the nesting depth is not
+    # tracked per thread.
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports = []  # [depth, module name, seconds], in the order loading started
+        self.milestones = []  # (label, seconds since start)
+        self.depth = 0
+        self.real_import = None
+
+    def install(self):
+        """Start timing imports"""
+        self.real_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        """Stop timing imports"""
+        if self.real_import is not None:
+            builtins.__import__ = self.real_import
+            self.real_import = None
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        """Replacement for __import__ that times modules not loaded yet"""
+        if level or name in sys.modules:
+            return self.real_import(name, globals, locals, fromlist, level)
+        record = [self.depth, name, 0.0]
+        self.imports.append(record)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            return self.real_import(name, globals, locals, fromlist, level)
+        finally:
+            record[2] = time.perf_counter() - start
+            self.depth -= 1
+
+    def mark(self, label):
+        """Record a milestone, e.g. when the main window is shown"""
+        self.milestones.append((label, time.perf_counter() - self.started))
+
+    def report(self, min_ms=1.0, max_depth=2):
+        """Print the milestones and the imports that took at least min_ms"""
+        print("Startup profile (times since main.py started):")
+        for label, seconds in self.milestones:
+            print(f"  {seconds * 1000:8.1f} ms  {label}")
+        top_level = sum(seconds for depth, name, seconds in self.imports if depth == 0)
+        print(f"Imports ({top_level * 1000:.1f} ms total; nested imports are indented "
+              f"and included in their parent's time):")
+        for depth, name, seconds in self.imports:
+            if depth <= max_depth and seconds * 1000 >= min_ms:
+                print(f"  {seconds * 1000:8.1f} ms  {'  ' * depth}{name}")
+
+# Export class
+__all__ = ['StartupProfiler']
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The application modules live in the repository root; Qt needs no display for the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
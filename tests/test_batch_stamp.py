@@ -0,0 +1,48 @@
+import json
+import os
+
+import fitz  # PyMuPDF
+import pytest
+
+import batch_stamp
+
+def make_pdf(path):
+    """Write a one-page PDF"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    doc = fitz.open()
+    doc.new_page()
+    doc.save(path)
+    doc.close()
+
+def make_spec(tmp_path):
+    """Write a spec with one text overlay"""
+    spec_path = tmp_path / 'spec.json'
+    spec_path.write_text(json.dumps({'overlays': [
+        {'type': 'text', 'page': 0, 'x': 72, 'y': 40, 'text': 'APPROVED'}]}))
+    return str(spec_path)
+
+def test_same_basename_with_output_dir_is_rejected_before_stamping(tmp_path, capsys):
+    first, second = str(tmp_path / 'a' / 'x.pdf'), str(tmp_path / 'b' / 'x.pdf')
+    make_pdf(first)
+    make_pdf(second)
+    output_dir = tmp_path / 'out'
+
+    with pytest.raises(SystemExit) as exit_info:
+        batch_stamp.main([make_spec(tmp_path), first, second, '-o', str(output_dir), '--suffix', '_signed'])
+
+    assert exit_info.value.code == 2
+    error = capsys.readouterr().err
+    assert 'x_signed.pdf' in error and first in error and second in error
+    assert not output_dir.exists()  # Rejected before any work started
+
+def test_same_basename_next_to_inputs_is_allowed(tmp_path):
+    first, second = str(tmp_path / 'a' / 'x.pdf'), str(tmp_path / 'b' / 'x.pdf')
+    make_pdf(first)
+    make_pdf(second)
+
+    assert batch_stamp.find_output_collisions([first, second], None, '_signed') == {}
+    assert batch_stamp.main([make_spec(tmp_path), first, second, '--suffix', '_signed', '-j', '1']) == 0
+    for path in (tmp_path / 'a' / 'x_signed.pdf', tmp_path / 'b' / 'x_signed.pdf'):
+        doc = fitz.open(str(path))
+        assert 'APPROVED' in doc[0].get_text()
+        doc.close()
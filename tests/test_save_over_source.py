@@ -0,0 +1,82 @@
+import time
+
+import fitz  # PyMuPDF
+import pytest
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox
+
+from overlay_model import Overlay
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication(['tests'])
+
+@pytest.fixture
+def window(app, monkeypatch, tmp_path):
+    """Main window with tmp_path/source.pdf open; dialogs answer without showing"""
+    import main
+    source = str(tmp_path / 'source.pdf')
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page()
+    doc.save(source)
+    doc.close()
+
+    monkeypatch.setattr(QFileDialog, 'getOpenFileName', staticmethod(lambda *args, **kwargs: (source, '')))
+    monkeypatch.setattr(QFileDialog, 'getSaveFileName', staticmethod(lambda *args, **kwargs: (source, '')))
+    monkeypatch.setattr(QMessageBox, 'information', staticmethod(lambda *args, **kwargs: None))
+    monkeypatch.setattr(QMessageBox, 'question',
+                        staticmethod(lambda *args, **kwargs: QMessageBox.StandardButton.No))
+    errors = []
+    for name in ('warning', 'critical'):
+        monkeypatch.setattr(QMessageBox, name, staticmethod(lambda *args, **kwargs: errors.append(args[2])))
+
+    window = main.MeshPDFApp()
+    window.errors = errors
+    window.import_pdf()
+    yield window
+    window.pdf_viewer.overlay_model.clear()  # Nothing to ask about when closing
+    window.close()
+
+def save(app, window):
+    """Save over the open file and wait until saving has finished"""
+    started = window.save_pdf()
+    deadline = time.monotonic() + 30
+    while window.save_task is not None and time.monotonic() < deadline:
+        app.processEvents()
+    return started
+
+def page_text(path, page_num):
+    doc = fitz.open(path)
+    try:
+        return doc[page_num].get_text()
+    finally:
+        doc.close()
+
+def test_saving_over_the_source_twice_stamps_overlays_once(app, window):
+    source = window.current_file
+    viewer = window.pdf_viewer
+    viewer.add_overlay(Overlay('text', 0, 72, 40, text='APPROVED'))
+
+    assert save(app, window)
+    assert page_text(source, 0).split() == ['APPROVED']
+    # The saved overlays are now part of the pages the viewer shows
+    assert len(viewer.overlay_model) == 0
+    assert not viewer.session.changed_on_disk()
+    assert 'APPROVED' in viewer.current_doc[0].get_text()
+
+    viewer.add_overlay(Overlay('text', 1, 72, 40, text='CHECKED'))
+    assert save(app, window)
+    assert page_text(source, 0).split() == ['APPROVED']
+    assert page_text(source, 1).split() == ['CHECKED']
+    assert window.errors == []
+
+def test_stale_session_refuses_to_save_over_the_source_again(app, window):
+    source = window.current_file
+    editor = window.pdf_editor
+    editor.add_text_at('APPROVED', 0, (72, 40), 14)
+    assert editor.save_pdf(source)
+
+    # Without reopening, the editor still refers to the pages as they were
+    editor.add_text_at('APPROVED', 0, (72, 40), 14)
+    assert editor.save_pdf(source) is False
+    assert page_text(source, 0).split() == ['APPROVED']
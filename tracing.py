@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+
+# Named timing spans for diagnosing slow operations:
+#
+#     with tracing.span('save', modifications=3) as s:
+#         ...
+#         s.set(incremental=True)
+#
+# Tracing is off by default. While off, span() is a function that returns one
+# shared do-nothing object, so instrumented code pays only for the call. enable()
+# swaps in the recording version; export() writes the events as JSON lines
+# (.jsonl) or as a Chrome trace (anything else) that chrome://tracing and
+# Perfetto can open. Call tracing.span() through the module rather than importing
+# span by name, so that enable() takes effect everywhere.
+
+_events = []  # Recorded spans and counters; list.append is atomic, so threads can share it
+_origin = time.perf_counter()
+_output_path = None
+_thread_names = {}  # Thread ident -> name, for threads that recorded events
+
+def _current_thread():
+    """Ident of the calling thread, remembering its name for export"""
+    ident = threading.get_ident()
+    if ident not in _thread_names:
+        _thread_names[ident] = threading.current_thread().name
+    return ident
+
+class _NullSpan:
+    """Span returned while tracing is off"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    """A timed operation; args are recorded with it and can be added while it runs"""
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.args['error'] = str(exc) or exc_type.__name__
+        _events.append(('X', self.name, self.start, end - self.start, _current_thread(), self.args))
+        return False
+
+    def set(self, **args):
+        """Add or update recorded values, e.g. counts known only at the end"""
+        self.args.update(args)
+
+def _null_span(name, **args):
+    return _NULL_SPAN
+
+def _null_counter(name, **values):
+    pass
+
+def _record_span(name, **args):
+    return Span(name, args)
+
+def _record_counter(name, **values):
+    _events.append(('C', name, time.perf_counter(), 0.0, _current_thread(), values))
+
+# Rebound by enable() and disable()
+span = _null_span
+counter = _null_counter
+
+def enable(output_path=None):
+    """Start recording; if output_path is given, events are written there by export()"""
+    global span, counter, _output_path
+    span = _record_span
+    counter = _record_counter
+    _output_path = output_path
+
+def disable():
+    """Stop recording; events recorded so far are kept for export()"""
+    global span, counter
+    span = _null_span
+    counter = _null_counter
+
+def is_enabled():
+    """True while spans are recorded"""
+    return span is _record_span
+
+def enable_from_environment(variable='MESHPDF_TRACE'):
+    """Enable tracing if the environment variable names an output file; returns the path"""
+    path = os.environ.get(variable)
+    if path:
+        enable(path)
+    return path
+
+def events():
+    """Recorded events as dicts, oldest first; times in milliseconds since the module loaded"""
+    return [{
+        'type': 'span' if kind == 'X' else 'counter',
+        'name': name,
+        'start_ms': (start - _origin) * 1000,
+        'duration_ms': duration * 1000,
+        'thread': _thread_names.get(thread, thread),
+        'args': args,
+    } for kind, name, start, duration, thread, args in list(_events)]
+
+def export(path=None):
+    """Write recorded events to path (default: the enable() path); returns the path or None"""
+    path = path or _output_path
+    if not path:
+        return None
+    if path.endswith('.jsonl'):
+        with open(path, 'w', encoding='utf-8') as f:
+            for event in events():
+                f.write(json.dumps(event, default=str) + '\n')
+    else:
+        pid = os.getpid()
+        trace_events = [{
+            'name': name,
+            'ph': kind,
+            'ts': (start - _origin) * 1e6,  # Microseconds
+            'dur': duration * 1e6,
+            'pid': pid,
+            'tid': thread,
+            'args': args,
+        } for kind, name, start, duration, thread, args in list(_events)]
+        for event in trace_events:
+            if event['ph'] == 'C':
+                del event['dur']
+        # Name the thread rows, e.g. the render workers
+        trace_events += [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread,
+                          'args': {'name': name}} for thread, name in list(_thread_names.items())]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f, default=str)
+    print(f"Trace with {len(_events)} events written to {path}")
+    return path
+
+def clear():
+    """Discard recorded events"""
+    _events.clear()
+
+# Export functions
+__all__ = ['span', 'counter', 'enable', 'disable', 'is_enabled', 'enable_from_environment',
+           'events', 'export', 'clear', 'Span']